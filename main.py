@@ -8,25 +8,34 @@ import os
 import sys
 import logging
 import asyncio
-from datetime import datetime, timezone
-from typing import Dict, Set, Optional, List, Any
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache, partial
+from datetime import datetime
+from typing import Dict, Set, Optional, List, Any, Tuple
 import json
+import html
+import math
+import re
 
 # Telegram Bot imports
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand
+from telegram import Update, User, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand
 from telegram.ext import (
     Application, CommandHandler, CallbackQueryHandler, 
-    MessageHandler, filters, ContextTypes
+    MessageHandler, filters, ContextTypes, AIORateLimiter
 )
 
 # Firebase imports
 import firebase_admin
-from firebase_admin import credentials, firestore
+from firebase_admin import credentials, firestore, firestore_async
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Resolved once, so the bot finds its credentials regardless of the working directory
+SERVICE_ACCOUNT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serviceAccountKey.json')
+
 # Configure logging
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -34,56 +43,367 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Keep per-request/per-RPC library logging out of the INFO stream
+for noisy_logger in ('httpx', 'firebase_admin', 'google'):
+    logging.getLogger(noisy_logger).setLevel(logging.WARNING)
+
+# Cache bounds (entries) and lifetimes (seconds)
+USER_CACHE_MAX_SIZE = 10000
+USER_CACHE_TTL = 3600
+DOCUMENT_CACHE_MAX_SIZE = 10000
+DOCUMENT_CACHE_TTL = 300
+NEGATIVE_CACHE_TTL = 30
+ACTIVE_SHOPS_CACHE_TTL = 60  # seconds the /start shop list is reused
+SHOP_REFRESH_INTERVAL = ACTIVE_SHOPS_CACHE_TTL  # seconds between background reloads, only when the list was used
+PRODUCT_LIST_CACHE_TTL = 30  # stock changes from the dashboard show up within this window
+MENU_CACHE_MAX_SIZE = 1024
+OWNERSHIP_CACHE_TTL = 60  # seconds an ownership check result is reused
+PHOTO_FILE_ID_TTL = 86400  # seconds an uploaded image's Telegram file_id is reused
+PREFETCH_PRODUCT_COUNT = 5  # top products of a category whose documents are read ahead
+CACHE_SWEEP_INTERVAL = 60  # seconds between purges of expired cache entries
+DEPARTMENT_ROUTING_FIELDS = ['shopId', 'role', 'telegramChatId']  # department fields the owner and chat index reads
+
+# Batched user-document writes (profiles and shop interactions)
+USER_WRITE_FLUSH_INTERVAL = 0.5  # seconds between flushes
+USER_WRITE_FLUSH_THRESHOLD = 400  # pending users that trigger an early flush
+USER_WRITE_MAX_BACKOFF = 30  # seconds between flushes after repeated commit failures
+INTERACTION_WRITE_DEBOUNCE = 30  # seconds a persisted shop visit is not rewritten
+FIRESTORE_BATCH_LIMIT = 500
+
+# Outgoing Telegram requests
+RATE_LIMIT_MAX_RETRIES = 2  # times a flood-limited request is retried after Telegram's retry_after
+
+# Per-chat update workers
+CHAT_WORKER_CONCURRENCY = 20  # chats whose updates are processed at the same time
+CHAT_QUEUE_SIZE = 100  # pending updates per chat; newer ones are refused with a reply beyond this
+CALLBACK_DRAIN_TIMEOUT = 10  # seconds shutdown waits for queued updates to finish
+
+# Optional webhook delivery; long polling is used when TELEGRAM_WEBHOOK_URL is unset
+WEBHOOK_URL_PATH = 'telegram'
+DEFAULT_WEBHOOK_PORT = 8443
+
+# Sentinel stored for documents that do not exist in Firestore
+NOT_FOUND = object()
+
+# Callback actions and the number of ids that follow them in callback_data
+CALLBACK_ACTIONS = {
+    'refresh_shops': 0,
+    'shops_page': 1,
+    'shop': 1,
+    'category': 2,
+    'category_page': 3,
+    'product': 2,
+    'order': 2,
+    'add_category': 1,
+    'add_product_category': 2,
+    'add_product': 1,
+    'shop_stats': 1,
+    'shop_settings': 1,
+    'manage_staff': 1,
+    'view_analytics': 1,
+    'send_announcement': 1,
+    'skip_category_desc': 1,
+    'skip_category_icon': 1,
+    'skip_product_desc': 1,
+}
+CALLBACK_ACTION_MAX_WORDS = max(action.count('_') + 1 for action in CALLBACK_ACTIONS)
+
+# Short codes used on the wire; ids follow separated by '/', which Firestore ids cannot contain
+CALLBACK_CODES = {
+    'refresh_shops': 'r',
+    'shops_page': 'sp',
+    'shop': 's',
+    'category': 'c',
+    'category_page': 'cp',
+    'product': 'p',
+    'order': 'o',
+    'add_category': 'ac',
+    'add_product_category': 'apc',
+    'add_product': 'ap',
+    'shop_stats': 'ss',
+    'shop_settings': 'st',
+    'manage_staff': 'ms',
+    'view_analytics': 'va',
+    'send_announcement': 'sa',
+    'skip_category_desc': 'kcd',
+    'skip_category_icon': 'kci',
+    'skip_product_desc': 'kpd',
+}
+CALLBACK_CODE_ACTIONS = {code: action for action, code in CALLBACK_CODES.items()}
+CALLBACK_SEPARATOR = '/'
+
+# Fields the bot renders from listed documents; queries project to these
+CATEGORY_LIST_FIELDS = ['name', 'description', 'icon', 'order', 'shopId']
+PRODUCT_LIST_FIELDS = ['name', 'price', 'stock']
+PRODUCT_PAGE_SIZE = 50  # products per page of a category; keeps the keyboard well under Telegram's button cap
+CALLBACK_DATA_MAX_BYTES = 64  # Telegram's limit for a button's callback_data
+DOCUMENT_ID_FIELD = '__name__'  # Firestore's field path for ordering and paging by document ID
+SHOP_PAGE_SIZE = 50  # shops per page of the welcome list
+MAX_ACTIVE_SHOPS = 10 * SHOP_PAGE_SIZE  # most shops read into the shared welcome list
+
+# Accepted wizard input: plain decimal prices and whole stock counts (no signs, exponents, inf or nan)
+PRICE_PATTERN = re.compile(r'[0-9]{1,9}(?:\.[0-9]*)?|\.[0-9]+')
+STOCK_PATTERN = re.compile(r'[0-9]{1,9}')
+MAX_PRODUCT_PRICE = 1_000_000
+
+# Static message fragments and formatting shared by the handlers
+PARSE_MARKDOWN = 'Markdown'
+PARSE_HTML = 'HTML'
+SHOP_PROMPT_TEXT = "🏪 Choose a shop to browse:\n\n"
+NO_SHOPS_TEXT = "❌ No shops available at the moment."
+CHAT_BUSY_TEXT = "⏳ Still working on your earlier requests. Please try again in a moment."
+
+ORDER_CONFIRMATION_TEMPLATE = (
+    "✅ **Order Request Sent!**\n\n"
+    "🛍️ **Product:** {product_name}\n"
+    "💰 **Price:** ${price:.2f}\n"
+    "📋 **Order ID:** #{short_order_id}\n\n"
+    "📞 **Next Steps:**\n"
+    "The shop owner will contact you shortly to confirm your order and arrange payment/delivery.\n\n"
+    "Thank you for your order! 🙏"
+)
+
+CATEGORY_CREATED_TEMPLATE = (
+    "✅ **Category Created Successfully!**\n\n"
+    "📂 **Name:** {name}\n"
+    "🎨 **Icon:** {icon}\n"
+    "{description_line}"
+    "\n🎉 Category is now available in your shop!"
+)
+
+PRODUCT_CREATED_TEMPLATE = (
+    "✅ **Product Created Successfully!**\n\n"
+    "🛍️ **Name:** {name}\n"
+    "📂 **Category:** {category_name}\n"
+    "💰 **Price:** ${price:.2f}\n"
+    "📦 **Stock:** {stock}\n"
+    "{description_line}"
+    "\n🎉 Product is now available in your shop!"
+)
+
+DESCRIPTION_LINE_TEMPLATE = "📝 **Description:** {}\n"
+
+# Wizard prompts shared by the typed-answer and skip-button paths
+CATEGORY_ICON_PROMPT_TEXT = "🎨 Please send an emoji icon for this category (or send 'skip' for default 📦):"
+PRODUCT_PRICE_PROMPT_TEXT = "💰 Please send the price (numbers only, e.g., 25.99):"
+SKIP_BUTTON_LABELS = {
+    'skip_category_desc': "⏭️ Skip Description",
+    'skip_category_icon': "📦 Use Default Icon",
+    'skip_product_desc': "⏭️ Skip Description",
+}
+
+ORDER_NOTIFICATION_TEMPLATE = """🛍️ <b>New Telegram Order</b>
+
+📋 Order ID: #{short_order_id}
+👤 Customer: {customer_name}
+📱 Telegram: @{telegram_username}
+🆔 User ID: {telegram_id}
+💰 Total: ${total:.2f}
+🚚 Method: {delivery_method}
+💳 Payment: {payment_preference}
+
+📦 <b>Items:</b>
+{items_text}
+
+⏰ Ordered: {ordered_at}
+
+<i>Please approve or reject this order</i>"""
+
+# Actions that only render a screen; a newer click in the same chat supersedes them
+NAVIGATION_ACTIONS = frozenset({'refresh_shops', 'shops_page', 'shop', 'category', 'category_page', 'product'})
+
+@lru_cache(maxsize=4096)
+def make_callback_data(action: str, *ids: str) -> str:
+    """Encode an action and its ids as compact callback data"""
+    return CALLBACK_SEPARATOR.join((CALLBACK_CODES[action],) + ids)
+
+@lru_cache(maxsize=4096)
+def parse_callback_data(data: str) -> Optional[Tuple[str, Tuple[str, ...]]]:
+    """Decode callback data into its action and that action's ids"""
+    code, *ids = data.split(CALLBACK_SEPARATOR)
+    action = CALLBACK_CODE_ACTIONS.get(code)
+    if action is None:
+        # Buttons sent before the compact encoding still carry the old format
+        return parse_legacy_callback_data(data)
+
+    if len(ids) != CALLBACK_ACTIONS[action] or not all(ids):
+        return None
+    return action, tuple(ids)
+
+def parse_legacy_callback_data(data: str) -> Optional[Tuple[str, Tuple[str, ...]]]:
+    """Split underscore-joined callback data into its longest registered action and ids"""
+    tokens = data.split('_')
+    for words in range(min(CALLBACK_ACTION_MAX_WORDS, len(tokens)), 0, -1):
+        action = '_'.join(tokens[:words])
+        id_count = CALLBACK_ACTIONS.get(action)
+        if id_count is None:
+            continue
+
+        ids = tokens[words:]
+        if id_count == 1:
+            # A lone id may itself contain underscores
+            ids = ['_'.join(ids)]
+        if len(ids) < id_count or not all(ids[:id_count]):
+            return None
+        return action, tuple(ids[:id_count])
+
+    return None
+
+@lru_cache(maxsize=1024)
+def back_to_categories_button(shop_id: str) -> InlineKeyboardButton:
+    """Get the shared "Back to Categories" button for a shop"""
+    return InlineKeyboardButton("⬅️ Back to Categories", callback_data=make_callback_data('shop', shop_id))
+
+@lru_cache(maxsize=1024)
+def shop_home_button(shop_id: str) -> InlineKeyboardButton:
+    """Get the shared "Back to Shop" button closing the admin creation flows"""
+    return InlineKeyboardButton("🏪 Back to Shop", callback_data=make_callback_data('shop', shop_id))
+
+@lru_cache(maxsize=1024)
+def add_another_product_button(shop_id: str) -> InlineKeyboardButton:
+    """Get the shared "Add Another Product" button for a shop"""
+    return InlineKeyboardButton("➕ Add Another Product", callback_data=make_callback_data('add_product', shop_id))
+
+@lru_cache(maxsize=1024)
+def skip_step_markup(action: str, shop_id: str) -> InlineKeyboardMarkup:
+    """Get the single-button keyboard that skips a wizard step"""
+    return InlineKeyboardMarkup([[InlineKeyboardButton(SKIP_BUTTON_LABELS[action], callback_data=make_callback_data(action, shop_id))]])
+
+@lru_cache(maxsize=1024)
+def back_to_shop_markup(shop_id: str) -> InlineKeyboardMarkup:
+    """Get the single-button "Back to Shop" keyboard for a shop"""
+    return InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Back to Shop", callback_data=make_callback_data('shop', shop_id))]])
+
+# Single-button rows of the shop owner's admin panel, below the add buttons
+ADMIN_PANEL_BUTTONS = (
+    ("📊 Shop Stats", 'shop_stats'),
+    ("⚙️ Shop Settings", 'shop_settings'),
+    ("👥 Manage Staff", 'manage_staff'),
+    ("📈 View Analytics", 'view_analytics'),
+    ("🔔 Send Announcement", 'send_announcement'),
+)
+
+@lru_cache(maxsize=1024)
+def shop_admin_rows(shop_id: str) -> Tuple[Tuple[InlineKeyboardButton, ...], ...]:
+    """Get the admin panel keyboard rows for a shop"""
+    add_row = (
+        InlineKeyboardButton("➕ Add Category", callback_data=make_callback_data('add_category', shop_id)),
+        InlineKeyboardButton("➕ Add Product", callback_data=make_callback_data('add_product', shop_id)),
+    )
+    return (add_row,) + tuple(
+        (InlineKeyboardButton(label, callback_data=make_callback_data(action, shop_id)),)
+        for label, action in ADMIN_PANEL_BUTTONS
+    )
+
+@lru_cache(maxsize=1024)
+def shop_menu_footer_rows(shop_id: str) -> Tuple[Tuple[InlineKeyboardButton, ...], ...]:
+    """Get the "Refresh Menu" and "Back to Shops" rows closing a shop menu"""
+    return (
+        (InlineKeyboardButton("🔄 Refresh Menu", callback_data=make_callback_data('shop', shop_id)),),
+        (InlineKeyboardButton("⬅️ Back to Shops", callback_data=make_callback_data('refresh_shops')),),
+    )
+
+class TTLCache:
+    """LRU cache with a size bound and lazily expired per-entry TTL"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key, default=None):
+        """Get a live entry, evicting it if it has expired"""
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+
+        value, expires_at = entry
+        if time.monotonic() > expires_at:
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        """Store an entry, evicting the least recently used when full"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove an entry and return its value"""
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def purge_expired(self) -> int:
+        """Drop every expired entry and return how many were removed"""
+        now = time.monotonic()
+        expired = [key for key, (_, expires_at) in self._data.items() if now > expires_at]
+        for key in expired:
+            del self._data[key]
+        return len(expired)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, NOT_FOUND) is not NOT_FOUND
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class CachedUser:
+    """Cached Telegram profile and shop navigation state of a user"""
+
+    # Fixed fields, so thousands of cached users carry no per-instance __dict__
+    __slots__ = ('telegram_id', 'username', 'first_name', 'last_name', 'created_at', 'last_shop_id')
+    PROFILE_FIELDS = ('username', 'first_name', 'last_name', 'last_shop_id')
+
+    def __init__(self, telegram_id: int):
+        self.telegram_id = telegram_id
+        self.username: Optional[str] = None
+        self.first_name: Optional[str] = None
+        self.last_name: Optional[str] = None
+        self.created_at = time.time()  # epoch seconds; the stored document uses SERVER_TIMESTAMP
+        self.last_shop_id: Optional[str] = None
+
 class UserCache:
     """In-memory cache for user data and shop interactions"""
 
     def __init__(self):
-        self.users: Dict[int, Dict] = {}
-        self.shop_members: Dict[str, Set[int]] = {}
-        self.user_sessions: Dict[int, Dict] = {}
+        self.users = TTLCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL)
+        self.user_sessions = TTLCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL)
 
     def add_user(self, telegram_id: int, user_data: Dict):
         """Add or update user in cache"""
-        self.users[telegram_id] = {
-            'telegram_id': telegram_id,
-            'username': user_data.get('username'),
-            'first_name': user_data.get('first_name'),
-            'last_name': user_data.get('last_name'),
-            'created_at': datetime.now(timezone.utc).isoformat(),
-            'last_shop_id': user_data.get('last_shop_id'),
-            'shops': user_data.get('shops', {}),
-            **user_data
-        }
-        logger.info(f"Cached user {telegram_id}: {user_data.get('first_name', 'Unknown')}")
-
-    def get_user(self, telegram_id: int) -> Optional[Dict]:
+        # Update the cached entry in place so a profile update keeps the user's last shop
+        user = self.users.get(telegram_id)
+        if user is None:
+            user = CachedUser(telegram_id)
+        for field in CachedUser.PROFILE_FIELDS:
+            if field in user_data:
+                setattr(user, field, user_data[field])
+        self.users.set(telegram_id, user)
+        logger.debug("Cached user %s: %s", telegram_id, user.first_name or 'Unknown')
+
+    def get_user(self, telegram_id: int) -> Optional[CachedUser]:
         """Get user from cache"""
         return self.users.get(telegram_id)
 
     def update_shop_interaction(self, telegram_id: int, shop_id: str):
         """Update user's last shop interaction"""
-        if telegram_id in self.users:
-            now = datetime.now(timezone.utc).isoformat()
-            self.users[telegram_id]['last_shop_id'] = shop_id
-            if 'shops' not in self.users[telegram_id]:
-                self.users[telegram_id]['shops'] = {}
-            self.users[telegram_id]['shops'][shop_id] = {'last_interacted': now}
-
-    def add_shop_member(self, shop_id: str, telegram_id: int):
-        """Add user to shop members"""
-        if shop_id not in self.shop_members:
-            self.shop_members[shop_id] = set()
-        self.shop_members[shop_id].add(telegram_id)
-
-    def get_shop_members(self, shop_id: str) -> List[int]:
-        """Get all members of a shop"""
-        return list(self.shop_members.get(shop_id, set()))
+        user = self.users.get(telegram_id)
+        if user is not None:
+            user.last_shop_id = shop_id
 
     def set_user_session(self, telegram_id: int, key: str, value: Any):
         """Set session data for user"""
-        if telegram_id not in self.user_sessions:
-            self.user_sessions[telegram_id] = {}
-        self.user_sessions[telegram_id][key] = value
+        session = self.user_sessions.get(telegram_id)
+        if session is None:
+            session = {}
+        session[key] = value
+        # Re-store to refresh the session's TTL
+        self.user_sessions.set(telegram_id, session)
 
     def get_user_session(self, telegram_id: int, key: str, default=None):
         """Get session data for user"""
@@ -91,11 +411,16 @@ class UserCache:
 
     def clear_user_session(self, telegram_id: int, key: str = None):
         """Clear session data for user"""
-        if telegram_id in self.user_sessions:
+        session = self.user_sessions.get(telegram_id)
+        if session is not None:
             if key:
-                self.user_sessions[telegram_id].pop(key, None)
+                session.pop(key, None)
             else:
-                self.user_sessions[telegram_id].clear()
+                self.user_sessions.pop(telegram_id)
+
+    def purge_expired(self) -> int:
+        """Drop expired users and sessions"""
+        return sum(cache.purge_expired() for cache in (self.users, self.user_sessions))
 
 class TelegramBot:
     """Main Telegram Bot class with Firebase integration"""
@@ -105,6 +430,79 @@ class TelegramBot:
         self.user_cache = UserCache()
         self.db = None
         self.shop_owners = {}  # Cache for shop owners: {shop_id: owner_telegram_id}
+
+        # Local index of the departments collection, kept current by a snapshot listener
+        self.departments: Dict[str, Dict] = {}  # {department_id: department_data}
+        self.shop_department_chats: Dict[str, Dict[str, List[str]]] = {}  # {shop_id: {role: [chat_id]}}
+        self.department_watch = None
+
+        # Firestore document caches (NOT_FOUND entries are negative-cached)
+        self.shop_cache = TTLCache(DOCUMENT_CACHE_MAX_SIZE, DOCUMENT_CACHE_TTL)
+        self.category_cache = TTLCache(DOCUMENT_CACHE_MAX_SIZE, DOCUMENT_CACHE_TTL)
+        self.product_cache = TTLCache(DOCUMENT_CACHE_MAX_SIZE, PRODUCT_LIST_CACHE_TTL)  # price and stock follow the listing's freshness
+        self.categories_by_shop_cache = TTLCache(DOCUMENT_CACHE_MAX_SIZE, DOCUMENT_CACHE_TTL)
+        self.active_shops_cache = TTLCache(1, ACTIVE_SHOPS_CACHE_TTL)  # 'shops' -> active shop documents
+        self.active_shops_used = False  # set by lookups, cleared by each background refresh
+        self.category_products_cache = TTLCache(DOCUMENT_CACHE_MAX_SIZE, PRODUCT_LIST_CACHE_TTL)  # (shop_id, category_id, cursor) -> (products, total, next_cursor)
+
+        # Telegram file_ids of product images already uploaded: {image_url: file_id}
+        self.photo_file_ids = TTLCache(DOCUMENT_CACHE_MAX_SIZE, PHOTO_FILE_ID_TTL)
+
+        # Background read-ahead tasks, referenced until they finish
+        self.prefetch_tasks: Set[asyncio.Task] = set()
+
+        # Document reads in progress, shared by concurrent cache misses: {(collection, doc_id): future}
+        self.inflight_reads: Dict[Tuple[str, str], asyncio.Future] = {}
+
+        # Ownership check results: {(shop_id, telegram_id): bool}
+        self.ownership_cache = TTLCache(USER_CACHE_MAX_SIZE, OWNERSHIP_CACHE_TTL)
+        # Linked Firebase UIDs: {telegram_id: uid}; they grant admin rights, so they age like ownership results
+        self.firebase_uid_cache = TTLCache(USER_CACHE_MAX_SIZE, OWNERSHIP_CACHE_TTL)
+
+        # Rendered shop menus: {(shop_id, is_admin): (fingerprint, text, reply_markup)}
+        self.menu_cache = TTLCache(MENU_CACHE_MAX_SIZE, DOCUMENT_CACHE_TTL)
+        # Rendered welcome shop list pages: (active shops list, {page: (text after the greeting, reply_markup)})
+        self.welcome_view: Optional[Tuple[List[Dict], Dict[int, Tuple[str, Optional[InlineKeyboardMarkup]]]]] = None
+        # Rendered category views: {(shop_id, category_id, cursor, is_admin): (category_data, products, text, reply_markup)}
+        self.category_view_cache = TTLCache(MENU_CACHE_MAX_SIZE, PRODUCT_LIST_CACHE_TTL)
+
+        # Coalesced user-document writes: {telegram_id: pending user fields}
+        self.pending_user_writes: Dict[int, Dict] = {}
+        self.persisted_interactions = TTLCache(USER_CACHE_MAX_SIZE, INTERACTION_WRITE_DEBOUNCE)
+        self.user_writes_ready = asyncio.Event()
+        self.user_write_failures = 0
+        self.user_writer_task: Optional[asyncio.Task] = None
+        self.cache_sweeper_task: Optional[asyncio.Task] = None
+        self.shop_refresher_task: Optional[asyncio.Task] = None
+
+        # Updates run in order within a chat and in parallel across chats
+        self.chat_queues: Dict[int, deque] = {}
+        self.chat_workers: Dict[int, asyncio.Task] = {}
+        self.chat_worker_slots = asyncio.Semaphore(CHAT_WORKER_CONCURRENCY)
+        self.latest_navigation = TTLCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL)  # (chat_id, user_id) -> update_id
+        self.callback_answer_tasks: Set[asyncio.Task] = set()
+
+        # Callback action -> handler, dispatched by button_callback
+        self.callback_handlers = {
+            'refresh_shops': self.on_refresh_shops,
+            'shops_page': self.on_shops_page,
+            'shop': self.on_shop,
+            'category': self.on_category,
+            'category_page': self.on_category_page,
+            'product': self.on_product,
+            'order': self.on_order,
+            'add_category': self.on_add_category,
+            'add_product_category': self.on_add_product_category,
+            'add_product': self.on_add_product,
+            'shop_stats': self.on_shop_stats,
+            'shop_settings': self.on_shop_settings,
+            'manage_staff': self.on_manage_staff,
+            'view_analytics': self.on_view_analytics,
+            'send_announcement': self.on_send_announcement,
+            'skip_category_desc': self.on_skip_category_desc,
+            'skip_category_icon': self.on_skip_category_icon,
+            'skip_product_desc': self.on_skip_product_desc,
+        }
         self.initialize_firebase()
 
     def initialize_firebase(self):
@@ -112,38 +510,93 @@ class TelegramBot:
         try:
             # Initialize Firebase Admin SDK
             if not firebase_admin._apps:
-                cred = credentials.Certificate('serviceAccountKey.json')
+                cred = credentials.Certificate(SERVICE_ACCOUNT_PATH)
                 firebase_admin.initialize_app(cred)
 
-            self.db = firestore.client()
+            # Single shared async client for every collection; it pools its own gRPC channel
+            self.db = firestore_async.client()
             logger.info("Firebase initialized successfully")
         except Exception as e:
-            logger.error(f"Failed to initialize Firebase: {e}")
+            logger.error("Failed to initialize Firebase: %s", e)
             sys.exit(1)
 
+    async def warm_up_firestore(self):
+        """Prime the Firestore channel and the shop caches before the first user arrives"""
+        try:
+            # Opens the connection and preloads the /start shop list and every active shop document
+            shops = await self.get_active_shops()
+            logger.info("Firestore connection warmed up with %d active shops", len(shops))
+        except Exception as e:
+            logger.warning("Firestore warm-up failed: %s", e)
+
     async def load_shop_owners(self):
         """Load shop owners from departments collection"""
         try:
-            # Get all owner departments
-            departments_ref = self.db.collection('departments').where('role', '==', 'owner')
-            departments = departments_ref.stream()
+            departments = await self.db.collection('departments').select(DEPARTMENT_ROUTING_FIELDS).get()
+            self.departments = {dept.id: dept.to_dict() for dept in departments}
+            self.rebuild_department_index()
+
+            logger.info("Loaded %d departments and %d shop owners", len(self.departments), len(self.shop_owners))
+        except Exception as e:
+            logger.error("Error loading shop owners: %s", e)
 
-            for dept in departments:
-                dept_data = dept.to_dict()
-                shop_id = dept_data.get('shopId')
-                telegram_id = dept_data.get('telegramChatId')  # For owner role, this is personal ID
+    def rebuild_department_index(self):
+        """Rebuild per-shop department chats and shop owners from the cached departments"""
+        shop_department_chats = {}
+        shop_owners = {}
 
-                if shop_id and telegram_id:
-                    try:
-                        # Convert to int and store
-                        self.shop_owners[shop_id] = int(telegram_id)
-                        logger.info(f"Loaded shop owner: shop {shop_id} -> owner {telegram_id}")
-                    except ValueError:
-                        logger.warning(f"Invalid owner Telegram ID: {telegram_id}")
+        for dept_data in self.departments.values():
+            shop_id = dept_data.get('shopId')
+            role = dept_data.get('role')
+            telegram_id = dept_data.get('telegramChatId')  # For owner role, this is personal ID
 
-            logger.info(f"Loaded {len(self.shop_owners)} shop owners")
+            if not (shop_id and telegram_id):
+                continue
+
+            shop_department_chats.setdefault(shop_id, {}).setdefault(role, []).append(telegram_id)
+
+            if role == 'owner':
+                try:
+                    # Convert to int and store
+                    shop_owners[shop_id] = int(telegram_id)
+                    logger.debug("Loaded shop owner: shop %s -> owner %s", shop_id, telegram_id)
+                except ValueError:
+                    logger.warning("Invalid owner Telegram ID: %s", telegram_id)
+
+        self.shop_department_chats = shop_department_chats
+        self.shop_owners = shop_owners
+
+    def apply_department_changes(self, changes: List[Tuple[str, Optional[Dict]]]):
+        """Apply (department_id, data) deltas from the listener; data is None for removals"""
+        for dept_id, dept_data in changes:
+            if dept_data is None:
+                self.departments.pop(dept_id, None)
+            else:
+                self.departments[dept_id] = dept_data
+        self.rebuild_department_index()
+
+    def start_department_listener(self):
+        """Watch the departments collection so the local index never needs a query"""
+        loop = asyncio.get_running_loop()
+
+        def on_snapshot(docs, changes, read_time):
+            # Runs on the listener's thread; hand the deltas to the event loop
+            deltas = [
+                (change.document.id, None if change.type.name == 'REMOVED' else change.document.to_dict())
+                for change in changes
+            ]
+            loop.call_soon_threadsafe(self.apply_department_changes, deltas)
+
+        try:
+            # Snapshot listeners are only available on the sync client
+            self.department_watch = firestore.client().collection('departments').on_snapshot(on_snapshot)
         except Exception as e:
-            logger.error(f"Error loading shop owners: {e}")
+            logger.error("Error starting departments listener: %s", e)
+
+    def get_department_chat_id(self, shop_id: str, role: str) -> Optional[str]:
+        """Get the first Telegram chat registered for a shop department role"""
+        chat_ids = self.shop_department_chats.get(shop_id, {}).get(role)
+        return chat_ids[0] if chat_ids else None
 
     async def is_shop_owner_by_telegram_id(self, telegram_id: int, shop_id: str) -> bool:
         """Check if Telegram user is the owner of the shop"""
@@ -160,15 +613,29 @@ class TelegramBot:
             'first_name': user.first_name,
             'last_name': user.last_name,
         }
+        # Load the stored user (last shop, Firebase UID) only the first time we see them
+        is_new_user = False
+        if self.user_cache.get_user(user.id) is None:
+            try:
+                stored_user = await self.load_user_from_firebase(user.id)
+                if stored_user:
+                    self.user_cache.add_user(user.id, stored_user)
+                    if stored_user.get('firebase_uid'):
+                        self.firebase_uid_cache.set(user.id, stored_user['firebase_uid'])
+                else:
+                    is_new_user = True
+            except Exception as e:
+                logger.error("Error loading user from Firebase: %s", e)
+
         self.user_cache.add_user(user.id, user_data)
 
-        # Save user to Firebase
-        await self.save_user_to_firebase(user.id, user_data)
+        # Save user to Firebase in the background; /start does not wait for the commit
+        self.save_user_to_firebase(user.id, user_data, is_new_user)
 
         # Check if user has a last interacted shop
         cached_user = self.user_cache.get_user(user.id)
-        if cached_user and cached_user.get('last_shop_id'):
-            shop_data = await self.get_shop_data(cached_user['last_shop_id'])
+        if cached_user and cached_user.last_shop_id:
+            shop_data = await self.get_shop_data(cached_user.last_shop_id)
             if shop_data:
                 await self.send_shop_menu(chat_id, shop_data, user.id, context)
                 return
@@ -176,65 +643,73 @@ class TelegramBot:
         # Show welcome message with available shops
         await self.send_welcome_message(chat_id, user.first_name, context)
 
-    async def save_user_to_firebase(self, telegram_id: int, user_data: Dict):
-        """Save user data to Firebase"""
-        try:
-            user_ref = self.db.collection('users').document(str(telegram_id))
-            user_doc = user_ref.get()
-
-            if user_doc.exists:
-                # Update existing user
-                user_ref.update({
-                    'username': user_data.get('username'),
-                    'first_name': user_data.get('first_name'),
-                    'last_name': user_data.get('last_name'),
-                    'updated_at': datetime.now(timezone.utc)
-                })
-            else:
-                # Create new user
-                user_ref.set({
-                    'telegram_id': telegram_id,
-                    'username': user_data.get('username'),
-                    'first_name': user_data.get('first_name'),
-                    'last_name': user_data.get('last_name'),
-                    'created_at': datetime.now(timezone.utc),
-                    'updated_at': datetime.now(timezone.utc),
-                    'shops': {},
-                    'last_shop_id': None
-                })
-
-            logger.info(f"Saved user {telegram_id} to Firebase")
-        except Exception as e:
-            logger.error(f"Error saving user to Firebase: {e}")
+    async def load_user_from_firebase(self, telegram_id: int) -> Optional[Dict]:
+        """Load stored user data from Firebase"""
+        user_doc = await self.db.collection('users').document(str(telegram_id)).get()
+        return user_doc.to_dict() if user_doc.exists else None
 
-    async def send_welcome_message(self, chat_id: int, first_name: str, context: ContextTypes.DEFAULT_TYPE):
-        """Send welcome message with available shops"""
+    def save_user_to_firebase(self, telegram_id: int, user_data: Dict, is_new_user: bool = False):
+        """Queue the user's profile for the next batched Firebase write"""
+        self.queue_user_write(telegram_id, {
+            'telegram_id': telegram_id,
+            'username': user_data.get('username'),
+            'first_name': user_data.get('first_name'),
+            'last_name': user_data.get('last_name'),
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+
+        if is_new_user:
+            # Defaults only, so a shop visit queued in the meantime is kept
+            self.queue_user_write(telegram_id, {
+                'created_at': firestore.SERVER_TIMESTAMP,
+                'shops': {},
+                'last_shop_id': None
+            }, overwrite=False)
+
+    async def get_active_shops(self, refresh: bool = False) -> List[Dict]:
+        """Get all active shops, warming the shop document cache with them"""
+        if not refresh:
+            self.active_shops_used = True
+            cached = self.active_shops_cache.get('shops')
+            if cached is not None:
+                return cached
+
+        # One read serves every user's pages and seeds shop_cache, so it is bounded rather
+        # than paged per user; name order keeps the pages stable, see firestore.indexes.json
+        shops_ref = self.db.collection('shops').where('isActive', '==', True).order_by('name')
+        shops = await shops_ref.limit(MAX_ACTIVE_SHOPS + 1).get()
+        if len(shops) > MAX_ACTIVE_SHOPS:
+            logger.warning("More than %d active shops; the welcome list shows the first %d by name",
+                           MAX_ACTIVE_SHOPS, MAX_ACTIVE_SHOPS)
+            shops = shops[:MAX_ACTIVE_SHOPS]
+
+        shop_list = []
+        for shop in shops:
+            shop_data = {'id': shop.id, **shop.to_dict()}
+            # The next click is usually one of these shops, so skip its document read
+            self.shop_cache.set(shop.id, shop_data)
+            shop_list.append(shop_data)
+
+        self.active_shops_cache.set('shops', shop_list)
+        return shop_list
+
+    async def send_welcome_message(self, chat_id: int, first_name: str, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
+        """Send welcome message with a page of the available shops"""
         try:
-            # Get all active shops
-            shops_ref = self.db.collection('shops').where('isActive', '==', True)
-            shops = shops_ref.stream()
-
-            text = f"👋 Welcome {first_name}!\n\n"
-            text += "🏪 Choose a shop to browse:\n\n"
+            shops = await self.get_active_shops()
 
-            keyboard = []
-            shop_count = 0
-
-            for shop in shops:
-                shop_data = shop.to_dict()
-                shop_count += 1
-                keyboard.append([InlineKeyboardButton(
-                    f"🏪 {shop_data['name']}", 
-                    callback_data=f"shop_{shop.id}"
-                )])
+            # Reuse rendered pages while the cached active shops are the same list object
+            if not self.welcome_view or self.welcome_view[0] is not shops:
+                self.welcome_view = (shops, {})
+            rendered_pages = self.welcome_view[1]
 
-            if shop_count == 0:
-                text += "❌ No shops available at the moment."
-                keyboard = []
-            else:
-                keyboard.append([InlineKeyboardButton("🔄 Refresh", callback_data="refresh_shops")])
+            # A button from before the list shrank falls back to the last page
+            page = max(0, min(page, (len(shops) - 1) // SHOP_PAGE_SIZE))
+            if page not in rendered_pages:
+                rendered_pages[page] = self.build_welcome_view(shops, page)
+            shops_text, reply_markup = rendered_pages[page]
 
-            reply_markup = InlineKeyboardMarkup(keyboard) if keyboard else None
+            text = f"👋 Welcome {first_name}!\n\n{shops_text}"
 
             await context.bot.send_message(
                 chat_id=chat_id,
@@ -243,23 +718,126 @@ class TelegramBot:
             )
 
         except Exception as e:
-            logger.error(f"Error sending welcome message: {e}")
+            logger.error("Error sending welcome message: %s", e)
             await context.bot.send_message(
                 chat_id=chat_id,
                 text="❌ Error loading shops. Please try again later."
             )
 
+    def build_welcome_view(self, shops: List[Dict], page: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+        """Render one page of the shop list shown under the welcome greeting"""
+        if not shops:
+            return SHOP_PROMPT_TEXT + NO_SHOPS_TEXT, None
+
+        start = page * SHOP_PAGE_SIZE
+        keyboard = [
+            [InlineKeyboardButton(f"🏪 {shop_data['name']}", callback_data=make_callback_data('shop', shop_data['id']))]
+            for shop_data in shops[start:start + SHOP_PAGE_SIZE]
+        ]
+
+        page_row = []
+        if page > 0:
+            page_row.append(InlineKeyboardButton("⬅️ Previous", callback_data=make_callback_data('shops_page', str(page - 1))))
+        if start + SHOP_PAGE_SIZE < len(shops):
+            page_row.append(InlineKeyboardButton("➡️ Next", callback_data=make_callback_data('shops_page', str(page + 1))))
+        if page_row:
+            keyboard.append(page_row)
+
+        keyboard.append([InlineKeyboardButton("🔄 Refresh", callback_data=make_callback_data('refresh_shops'))])
+        return SHOP_PROMPT_TEXT, InlineKeyboardMarkup(keyboard)
+
+    async def get_cached_document(self, cache: TTLCache, collection: str, doc_id: str) -> Optional[Dict]:
+        """Get a document through a TTL cache, negative-caching missing documents"""
+        cached = cache.get(doc_id)
+        if cached is not None:
+            return None if cached is NOT_FOUND else cached
+
+        # Concurrent misses for the same document share one read instead of stampeding Firestore
+        read_key = (collection, doc_id)
+        read = self.inflight_reads.get(read_key)
+        if read is None:
+            read = asyncio.ensure_future(self.load_cached_document(cache, collection, doc_id))
+            self.inflight_reads[read_key] = read
+            read.add_done_callback(lambda _: self.inflight_reads.pop(read_key, None))
+        # Shielded so one cancelled caller does not cancel the read for the others
+        return await asyncio.shield(read)
+
+    async def load_cached_document(self, cache: TTLCache, collection: str, doc_id: str) -> Optional[Dict]:
+        """Read a document from Firebase into its cache"""
+        doc_ref = self.db.collection(collection).document(doc_id)
+        doc = await doc_ref.get()
+
+        if not doc.exists:
+            cache.set(doc_id, NOT_FOUND, ttl=NEGATIVE_CACHE_TTL)
+            return None
+
+        data = {'id': doc_id, **doc.to_dict()}
+        cache.set(doc_id, data)
+        return data
+
+    async def load_cached_documents(self, cache: TTLCache, collection: str, doc_ids: List[str]):
+        """Read several documents into their cache with one batched get_all"""
+        # Registered like single reads, so a lookup during the batch waits for it instead of reading again
+        loop = asyncio.get_running_loop()
+        reads: Dict[str, asyncio.Future] = {}
+        for doc_id in doc_ids:
+            read_key = (collection, doc_id)
+            if read_key not in self.inflight_reads:
+                reads[doc_id] = self.inflight_reads[read_key] = loop.create_future()
+        if not reads:
+            return
+
+        refs = [self.db.collection(collection).document(doc_id) for doc_id in reads]
+        try:
+            async for doc in self.db.get_all(refs):
+                if doc.exists:
+                    data = {'id': doc.id, **doc.to_dict()}
+                    cache.set(doc.id, data)
+                else:
+                    data = None
+                    cache.set(doc.id, NOT_FOUND, ttl=NEGATIVE_CACHE_TTL)
+                read = reads.get(doc.id)
+                if read is not None and not read.done():
+                    read.set_result(data)
+        except Exception as e:
+            for read in reads.values():
+                if not read.done():
+                    read.set_exception(e)
+                    read.exception()  # waiters still get the error; a read nobody awaited is not logged
+            raise
+        finally:
+            for doc_id, read in reads.items():
+                if not read.done():
+                    read.cancel()
+                read_key = (collection, doc_id)
+                if self.inflight_reads.get(read_key) is read:
+                    del self.inflight_reads[read_key]
+
     async def get_shop_data(self, shop_id: str) -> Optional[Dict]:
         """Get shop data from Firebase"""
         try:
-            shop_ref = self.db.collection('shops').document(shop_id)
-            shop_doc = shop_ref.get()
+            return await self.get_cached_document(self.shop_cache, 'shops', shop_id)
+        except Exception as e:
+            logger.error("Error getting shop data: %s", e)
+            return None
 
-            if shop_doc.exists:
-                return {'id': shop_id, **shop_doc.to_dict()}
+    async def get_category_data(self, category_id: str) -> Optional[Dict]:
+        """Get category data from Firebase"""
+        try:
+            return await self.get_cached_document(self.category_cache, 'categories', category_id)
+        except Exception as e:
+            logger.error("Error getting category data: %s", e)
             return None
+
+    async def get_product_data(self, product_id: str, fresh: bool = False) -> Optional[Dict]:
+        """Get product data from Firebase"""
+        try:
+            if fresh:
+                # Drop the cached copy so the read reflects the current price and stock
+                self.product_cache.pop(product_id)
+            return await self.get_cached_document(self.product_cache, 'products', product_id)
         except Exception as e:
-            logger.error(f"Error getting shop data: {e}")
+            logger.error("Error getting product data: %s", e)
             return None
 
     async def send_shop_menu(self, chat_id: int, shop_data: Dict, user_id: int, context: ContextTypes.DEFAULT_TYPE):
@@ -269,75 +847,109 @@ class TelegramBot:
             self.user_cache.update_shop_interaction(user_id, shop_data['id'])
             await self.update_user_shop_interaction(user_id, shop_data['id'])
 
-            # Get shop categories
-            categories = await self.get_shop_categories(shop_data['id'])
-
-            text = f"🏪 **{shop_data['name']}**\n\n"
-
-            if shop_data.get('description'):
-                text += f"{shop_data['description']}\n\n"
-
-            # Check if user is shop owner for admin functions
-            is_owner = await self.is_shop_owner(user_id, shop_data['id'])
-            is_telegram_owner = await self.is_shop_owner_by_telegram_id(user_id, shop_data['id'])
-
-            if is_owner or is_telegram_owner:
-                text += "👑 **Admin Panel**\n\n"
-
-            if not categories:
-                text += "📂 No categories available yet."
-                if is_owner or is_telegram_owner:
-                    text += "\n\n➕ Use the buttons below to add categories and products."
+            # Get shop categories and check if user is shop owner for admin functions, concurrently
+            categories, is_owner, is_telegram_owner = await asyncio.gather(
+                self.get_shop_categories(shop_data['id']),
+                self.is_shop_owner(user_id, shop_data['id']),
+                self.is_shop_owner_by_telegram_id(user_id, shop_data['id'])
+            )
+            is_admin = is_owner or is_telegram_owner
+
+            # Reuse the rendered menu while the shop and its categories are unchanged
+            fingerprint = hash((
+                shop_data.get('name'),
+                shop_data.get('description'),
+                tuple((c['id'], c.get('name'), c.get('icon')) for c in categories)
+            ))
+            menu_key = (shop_data['id'], is_admin)
+            cached_menu = self.menu_cache.get(menu_key)
+
+            if cached_menu and cached_menu[0] == fingerprint:
+                _, text, reply_markup = cached_menu
             else:
-                text += "📂 Choose a category:"
-
-            keyboard = []
-
-            # Add category buttons
-            for category in categories:
-                keyboard.append([InlineKeyboardButton(
-                    f"{category.get('icon', '📦')} {category['name']}", 
-                    callback_data=f"category_{shop_data['id']}_{category['id']}"
-                )])
-
-            # Admin buttons for shop owners
-            if is_owner or is_telegram_owner:
-                admin_row = []
-                admin_row.append(InlineKeyboardButton("➕ Add Category", callback_data=f"add_category_{shop_data['id']}"))
-                admin_row.append(InlineKeyboardButton("➕ Add Product", callback_data=f"add_product_{shop_data['id']}"))
-                keyboard.append(admin_row)
-
-                keyboard.append([InlineKeyboardButton("📊 Shop Stats", callback_data=f"shop_stats_{shop_data['id']}")])
-                keyboard.append([InlineKeyboardButton("⚙️ Shop Settings", callback_data=f"shop_settings_{shop_data['id']}")])
-                keyboard.append([InlineKeyboardButton("👥 Manage Staff", callback_data=f"manage_staff_{shop_data['id']}")])
-                keyboard.append([InlineKeyboardButton("📈 View Analytics", callback_data=f"view_analytics_{shop_data['id']}")])
-                keyboard.append([InlineKeyboardButton("🔔 Send Announcement", callback_data=f"send_announcement_{shop_data['id']}")])
-
-            keyboard.append([InlineKeyboardButton("🔄 Refresh Menu", callback_data=f"shop_{shop_data['id']}")])
-            keyboard.append([InlineKeyboardButton("⬅️ Back to Shops", callback_data="refresh_shops")])
-
-            reply_markup = InlineKeyboardMarkup(keyboard)
+                text, reply_markup = self.build_shop_menu(shop_data, categories, is_admin)
+                self.menu_cache.set(menu_key, (fingerprint, text, reply_markup))
+                logger.debug("Rendered menu shop=%s categories=%d admin=%s", shop_data['id'], len(categories), is_admin)
 
             await context.bot.send_message(
                 chat_id=chat_id,
                 text=text,
                 reply_markup=reply_markup,
-                parse_mode='Markdown'
+                parse_mode=PARSE_MARKDOWN
             )
 
         except Exception as e:
-            logger.error(f"Error sending shop menu: {e}")
+            logger.error("Error sending shop menu: %s", e)
             await context.bot.send_message(
                 chat_id=chat_id,
                 text="❌ Error loading shop menu. Please try again."
             )
 
+    def build_shop_menu(self, shop_data: Dict, categories: List[Dict], is_admin: bool) -> Tuple[str, InlineKeyboardMarkup]:
+        """Render shop menu text and keyboard"""
+        text = f"🏪 **{shop_data['name']}**\n\n"
+
+        if shop_data.get('description'):
+            text += f"{shop_data['description']}\n\n"
+
+        if is_admin:
+            text += "👑 **Admin Panel**\n\n"
+
+        if not categories:
+            text += "📂 No categories available yet."
+            if is_admin:
+                text += "\n\n➕ Use the buttons below to add categories and products."
+        else:
+            text += "📂 Choose a category:"
+
+        # Add category buttons
+        keyboard = [
+            [InlineKeyboardButton(
+                f"{category.get('icon', '📦')} {category['name']}",
+                callback_data=make_callback_data('category', shop_data['id'], category['id'])
+            )]
+            for category in categories
+        ]
+
+        # Admin buttons for shop owners
+        if is_admin:
+            keyboard.extend(shop_admin_rows(shop_data['id']))
+
+        keyboard.extend(shop_menu_footer_rows(shop_data['id']))
+
+        return text, InlineKeyboardMarkup(keyboard)
+
     async def is_shop_owner(self, user_id: int, shop_id: str) -> bool:
         """Check if user is the owner of the shop"""
+        # Every admin screen checks ownership; reuse recent answers instead of re-reading both documents
+        cached = self.ownership_cache.get((shop_id, user_id))
+        if cached is not None:
+            return cached
+
         try:
-            # Get user document from Firebase to find their UID
+            is_owner = await self.fetch_shop_ownership(user_id, shop_id)
+        except Exception as e:
+            # Not cached, so a transient failure does not lock the owner out
+            logger.error("Error checking shop ownership: %s", e)
+            return False
+
+        self.ownership_cache.set((shop_id, user_id), is_owner)
+        return is_owner
+
+    async def fetch_shop_ownership(self, user_id: int, shop_id: str) -> bool:
+        """Check in Firebase if the user's linked account owns the shop"""
+        # A linked account seen in the last OWNERSHIP_CACHE_TTL needs no user document read
+        firebase_uid = self.firebase_uid_cache.get(user_id)
+
+        if firebase_uid:
+            shop_data = await self.get_cached_document(self.shop_cache, 'shops', shop_id)
+        else:
+            # Fetch the user document (for their UID) while the shop comes from the document cache
             user_ref = self.db.collection('users').document(str(user_id))
-            user_doc = user_ref.get()
+            user_doc, shop_data = await asyncio.gather(
+                user_ref.get(),
+                self.get_cached_document(self.shop_cache, 'shops', shop_id)
+            )
 
             if not user_doc.exists:
                 return False
@@ -348,147 +960,309 @@ class TelegramBot:
             if not firebase_uid:
                 return False
 
-            # Check if this Firebase UID owns the shop
-            shop_ref = self.db.collection('shops').document(shop_id)
-            shop_doc = shop_ref.get()
+            self.firebase_uid_cache.set(user_id, firebase_uid)
 
-            if shop_doc.exists:
-                shop_data = shop_doc.to_dict()
-                return shop_data.get('ownerId') == firebase_uid
-
-            return False
-        except Exception as e:
-            logger.error(f"Error checking shop ownership: {e}")
-            return False
+        # Check if this Firebase UID owns the shop
+        return bool(shop_data) and shop_data.get('ownerId') == firebase_uid
 
     async def update_user_shop_interaction(self, telegram_id: int, shop_id: str):
-        """Update user's shop interaction in Firebase"""
-        try:
-            user_ref = self.db.collection('users').document(str(telegram_id))
-            now = datetime.now(timezone.utc)
+        """Queue user's shop interaction for the next batched Firebase write"""
+        # A timestamp-only rewrite of a shop visit that was just persisted is not worth a write
+        if telegram_id not in self.pending_user_writes and self.persisted_interactions.get(telegram_id) == shop_id:
+            return
 
-            user_ref.update({
-                'last_shop_id': shop_id,
-                f'shops.{shop_id}.last_interacted': now,
-                'updated_at': now
-            })
+        # Stamped by Firestore at commit time, so a click does no clock or formatting work
+        self.queue_user_write(telegram_id, {
+            'last_shop_id': shop_id,
+            'shops': {shop_id: {'last_interacted': firestore.SERVER_TIMESTAMP}},
+            'updated_at': firestore.SERVER_TIMESTAMP
+        })
+
+    def queue_user_write(self, telegram_id: int, fields: Dict, overwrite: bool = True):
+        """Merge fields into the user's pending write; overwrite=False keeps already-queued values"""
+        pending = self.pending_user_writes.setdefault(telegram_id, {})
+        for key, value in fields.items():
+            if key == 'shops':
+                shops = pending.setdefault('shops', {})
+                for shop_id, shop_fields in value.items():
+                    if overwrite or shop_id not in shops:
+                        shops[shop_id] = shop_fields
+            elif overwrite or key not in pending:
+                pending[key] = value
+
+        if len(self.pending_user_writes) >= USER_WRITE_FLUSH_THRESHOLD:
+            self.user_writes_ready.set()
+
+    async def run_user_writer(self):
+        """Flush queued user writes periodically or once enough are pending"""
+        while True:
+            # Back off exponentially while commits keep failing
+            interval = min(USER_WRITE_FLUSH_INTERVAL * 2 ** self.user_write_failures, USER_WRITE_MAX_BACKOFF)
+            try:
+                await asyncio.wait_for(self.user_writes_ready.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self.user_writes_ready.clear()
+            await self.flush_user_writes()
+
+    async def flush_user_writes(self):
+        """Write all queued user fields to Firebase in batched commits"""
+        if not self.pending_user_writes:
+            return
 
-        except Exception as e:
-            logger.error(f"Error updating user shop interaction: {e}")
+        pending, self.pending_user_writes = self.pending_user_writes, {}
+        items = list(pending.items())
+        failed = False
+
+        for start in range(0, len(items), FIRESTORE_BATCH_LIMIT):
+            chunk = items[start:start + FIRESTORE_BATCH_LIMIT]
+            batch = self.db.batch()
+            for telegram_id, fields in chunk:
+                user_ref = self.db.collection('users').document(str(telegram_id))
+                # merge=True deep-merges the shops map and tolerates a missing user document
+                batch.set(user_ref, fields, merge=True)
+
+            try:
+                await batch.commit()
+                for telegram_id, fields in chunk:
+                    if fields.get('last_shop_id'):
+                        self.persisted_interactions.set(telegram_id, fields['last_shop_id'])
+            except Exception as e:
+                logger.error("Error writing %d user documents: %s", len(chunk), e)
+                failed = True
+                # Re-queue for the next flush, behind anything newer for the same users
+                for telegram_id, fields in chunk:
+                    self.queue_user_write(telegram_id, fields, overwrite=False)
+
+        self.user_write_failures = self.user_write_failures + 1 if failed else 0
 
     async def get_shop_categories(self, shop_id: str) -> List[Dict]:
         """Get categories for a shop"""
+        cached = self.categories_by_shop_cache.get(shop_id)
+        if cached is not None:
+            return cached
+
         try:
-            categories_ref = self.db.collection('categories').where('shopId', '==', shop_id)
-            categories = categories_ref.stream()
+            # Firestore returns them already sorted via the (shopId, order) index
+            categories_ref = (
+                self.db.collection('categories')
+                .where('shopId', '==', shop_id)
+                .order_by('order')
+                .select(CATEGORY_LIST_FIELDS)
+            )
+            categories = await categories_ref.get()
 
             category_list = []
             for category in categories:
                 category_data = category.to_dict()
                 category_data['id'] = category.id
+                # The user's next click is usually one of these categories, so skip its document read
+                self.category_cache.set(category.id, category_data)
                 category_list.append(category_data)
 
-            # Sort by order
-            category_list.sort(key=lambda x: x.get('order', 0))
+            self.categories_by_shop_cache.set(shop_id, category_list)
             return category_list
 
         except Exception as e:
-            logger.error(f"Error getting shop categories: {e}")
+            logger.error("Error getting shop categories: %s", e)
             return []
 
-    async def send_category_products(self, chat_id: int, shop_id: str, category_id: str, user_id: int, context: ContextTypes.DEFAULT_TYPE):
-        """Send products in a category"""
+    async def get_category_products(self, shop_id: str, category_id: str, category_name: str,
+                                    cursor: Optional[Tuple[Any, str]] = None) -> Tuple[List[Dict], Optional[int], Optional[Tuple[Any, str]]]:
+        """Get a page of available products in a shop category, the category's total and the next page's cursor"""
+        cache_key = (shop_id, category_id, cursor)
+        cached = self.category_products_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Filtered server-side, see firestore.indexes.json
+        products_ref = (
+            self.db.collection('products')
+            .where('shopId', '==', shop_id)
+            .where('category', '==', category_name)
+            .where('isActive', '==', True)
+            .where('stock', '>', 0)
+        )
+        # The stock range filter orders by stock; the document ID breaks ties so pages never overlap
+        page_query = products_ref.order_by('stock').order_by(DOCUMENT_ID_FIELD)
+        if cursor:
+            page_query = page_query.start_after({'stock': cursor[0], DOCUMENT_ID_FIELD: cursor[1]})
+        # One extra document tells whether another page follows
+        products = await page_query.select(PRODUCT_LIST_FIELDS).limit(PRODUCT_PAGE_SIZE + 1).get()
+
+        product_list = []
+        for product in products:
+            product_data = product.to_dict()
+            product_data['id'] = product.id
+            product_list.append(product_data)
+
+        next_cursor = None
+        if len(product_list) > PRODUCT_PAGE_SIZE:
+            del product_list[PRODUCT_PAGE_SIZE:]
+            next_cursor = (product_list[-1]['stock'], product_list[-1]['id'])
+
+        if cursor is None and next_cursor is None:
+            total = len(product_list)
+        else:
+            try:
+                # Count the whole category without downloading the other pages
+                count_result = await products_ref.count().get()
+                total = count_result[0][0].value
+            except Exception as e:
+                # The page is still worth showing without its total
+                logger.warning("Could not count products in category %s: %s", category_id, e)
+                total = None
+
+        result = (product_list, total, next_cursor)
+        self.category_products_cache.set(cache_key, result)
+        return result
+
+    def invalidate_shop_categories(self, shop_id: str):
+        """Drop cached category lists and rendered menus for a shop"""
+        self.categories_by_shop_cache.pop(shop_id)
+        self.menu_cache.pop((shop_id, True))
+        self.menu_cache.pop((shop_id, False))
+
+    async def send_category_products(self, chat_id: int, shop_id: str, category_id: str, user_id: int, context: ContextTypes.DEFAULT_TYPE,
+                                     cursor: Optional[Tuple[Any, str]] = None):
+        """Send a page of products in a category, starting after the cursor's product"""
         try:
-            # Get category data
-            category_ref = self.db.collection('categories').document(category_id)
-            category_doc = category_ref.get()
+            # Usually a cache hit: loading the shop's categories for its menu seeds the category cache
+            category_data = await self.get_category_data(category_id)
 
-            if not category_doc.exists:
+            if not category_data:
                 await context.bot.send_message(chat_id, "❌ Category not found.")
                 return
 
-            category_data = category_doc.to_dict()
-
-            # Get products in this category
-            products_ref = self.db.collection('products').where('shopId', '==', shop_id).where('category', '==', category_data['name'])
-            products = products_ref.stream()
-
-            text = f"📂 **{category_data['name']}**\n\n"
-
-            if category_data.get('description'):
-                text += f"{category_data['description']}\n\n"
-
-            keyboard = []
-            product_count = 0
-
-            for product in products:
-                product_data = product.to_dict()
-                if product_data.get('isActive', True) and product_data.get('stock', 0) > 0:
-                    product_count += 1
-                    price_text = f"${product_data['price']:.2f}"
-                    stock_text = f" ({product_data['stock']} left)" if product_data['stock'] <= 10 else ""
-
-                    keyboard.append([InlineKeyboardButton(
-                        f"{product_data['name']} - {price_text}{stock_text}",
-                        callback_data=f"product_{shop_id}_{product.id}"
-                    )])
+            # Get the products and ownership concurrently
+            (products, total, next_cursor), is_owner, is_telegram_owner = await asyncio.gather(
+                self.get_category_products(shop_id, category_id, category_data['name'], cursor),
+                self.is_shop_owner(user_id, shop_id),
+                self.is_shop_owner_by_telegram_id(user_id, shop_id)
+            )
+            is_admin = is_owner or is_telegram_owner
 
-            if product_count == 0:
-                text += "❌ No products available in this category."
+            # Reuse the rendered view while the cached category and product list are the same objects
+            view_key = (shop_id, category_id, cursor, is_admin)
+            cached_view = self.category_view_cache.get(view_key)
+            if cached_view and cached_view[0] is category_data and cached_view[1] is products:
+                _, _, text, reply_markup = cached_view
             else:
-                text += f"🛍️ Choose a product ({product_count} available):"
-
-            # Check if user is shop owner
-            is_owner = await self.is_shop_owner(user_id, shop_id)
-            is_telegram_owner = await self.is_shop_owner_by_telegram_id(user_id, shop_id)
-            if is_owner or is_telegram_owner:
-                keyboard.append([InlineKeyboardButton("➕ Add Product to Category", callback_data=f"add_product_category_{shop_id}_{category_id}")])
-
-            keyboard.append([InlineKeyboardButton("⬅️ Back to Categories", callback_data=f"shop_{shop_id}")])
-
-            reply_markup = InlineKeyboardMarkup(keyboard)
+                text, reply_markup = self.build_category_view(
+                    shop_id, category_id, category_data, products, total, next_cursor, cursor is None, is_admin
+                )
+                self.category_view_cache.set(view_key, (category_data, products, text, reply_markup))
 
             await context.bot.send_message(
                 chat_id=chat_id,
                 text=text,
                 reply_markup=reply_markup,
-                parse_mode='Markdown'
+                parse_mode=PARSE_MARKDOWN
             )
 
+            # The next click is usually a product; read its document while the user is choosing
+            self.prefetch(self.prefetch_products([product['id'] for product in products[:PREFETCH_PRODUCT_COUNT]]))
+
         except Exception as e:
-            logger.error(f"Error sending category products: {e}")
+            logger.error("Error sending category products: %s", e)
             await context.bot.send_message(chat_id, "❌ Error loading products.")
 
+    def prefetch(self, coro):
+        """Run read-ahead work in the background without blocking the current reply"""
+        task = asyncio.create_task(coro)
+        self.prefetch_tasks.add(task)
+        task.add_done_callback(self.prefetch_tasks.discard)
+
+    async def prefetch_products(self, product_ids: List[str]):
+        """Warm the product cache for products the user is likely to open next"""
+        missing = [product_id for product_id in product_ids if product_id not in self.product_cache]
+        if missing:
+            try:
+                await self.load_cached_documents(self.product_cache, 'products', missing)
+            except Exception as e:
+                logger.debug("Product prefetch failed: %s", e)
+
+    def build_category_view(self, shop_id: str, category_id: str, category_data: Dict, products: List[Dict], total: Optional[int],
+                            next_cursor: Optional[Tuple[Any, str]], is_first_page: bool, is_admin: bool) -> Tuple[str, InlineKeyboardMarkup]:
+        """Render one page of the product list text and keyboard for a category"""
+        text = f"📂 **{category_data['name']}**\n\n"
+
+        if category_data.get('description'):
+            text += f"{category_data['description']}\n\n"
+
+        keyboard = []
+        for product_data in products:
+            price_text = f"${product_data['price']:.2f}"
+            stock_text = f" ({product_data['stock']} left)" if product_data['stock'] <= 10 else ""
+
+            keyboard.append([InlineKeyboardButton(
+                f"{product_data['name']} - {price_text}{stock_text}",
+                callback_data=make_callback_data('product', shop_id, product_data['id'])
+            )])
+
+        if not products:
+            text += "❌ No products available in this category."
+        elif total is None:
+            text += "🛍️ Choose a product:"
+        elif total > len(products):
+            text += f"🛍️ Choose a product (showing {len(products)} of {total} available):"
+        else:
+            text += f"🛍️ Choose a product ({total} available):"
+
+        page_row = []
+        if not is_first_page:
+            page_row.append(InlineKeyboardButton("⏮️ First Page", callback_data=make_callback_data('category', shop_id, category_id)))
+        if next_cursor:
+            # The shop comes from the category document, so the cursor fits in callback_data
+            next_data = make_callback_data('category_page', category_id, str(next_cursor[0]), next_cursor[1])
+            if len(next_data.encode()) <= CALLBACK_DATA_MAX_BYTES:
+                page_row.append(InlineKeyboardButton("➡️ More Products", callback_data=next_data))
+            else:
+                logger.warning("Cursor for category %s does not fit in callback data; no next page button", category_id)
+        if page_row:
+            keyboard.append(page_row)
+
+        if is_admin:
+            keyboard.append([InlineKeyboardButton("➕ Add Product to Category", callback_data=make_callback_data('add_product_category', shop_id, category_id))])
+
+        keyboard.append([back_to_categories_button(shop_id)])
+
+        return text, InlineKeyboardMarkup(keyboard)
+
     async def send_product_details(self, chat_id: int, shop_id: str, product_id: str, user_id: int, context: ContextTypes.DEFAULT_TYPE):
         """Send product details with order option"""
         try:
-            # Get product data
-            product_ref = self.db.collection('products').document(product_id)
-            product_doc = product_ref.get()
+            # Get product data and shop categories (for the back button) concurrently
+            product_data, categories = await asyncio.gather(
+                self.get_product_data(product_id),
+                self.get_shop_categories(shop_id)
+            )
 
-            if not product_doc.exists:
+            if not product_data:
                 await context.bot.send_message(chat_id, "❌ Product not found.")
                 return
 
-            product_data = product_doc.to_dict()
-
             # Check if product is available
             is_available = product_data.get('isActive', True) and product_data.get('stock', 0) > 0
 
-            text = f"🛍️ **{product_data['name']}**\n\n"
+            parts = [f"🛍️ **{product_data['name']}**\n\n"]
 
             if product_data.get('description'):
-                text += f"📝 {product_data['description']}\n\n"
+                parts.append(f"📝 {product_data['description']}\n\n")
 
-            text += f"💰 **Price:** ${product_data['price']:.2f}\n"
-            text += f"📦 **Stock:** {product_data['stock']} available\n"
-            text += f"🏷️ **Category:** {product_data.get('category', 'N/A')}\n"
+            parts.append(
+                f"💰 **Price:** ${product_data['price']:.2f}\n"
+                f"📦 **Stock:** {product_data['stock']} available\n"
+                f"🏷️ **Category:** {product_data.get('category', 'N/A')}\n"
+            )
 
             if product_data.get('sku'):
-                text += f"🔖 **SKU:** {product_data['sku']}\n"
+                parts.append(f"🔖 **SKU:** {product_data['sku']}\n")
 
             if not is_available:
-                text += "\n❌ **Currently unavailable**"
+                parts.append("\n❌ **Currently unavailable**")
+
+            text = ''.join(parts)
 
             keyboard = []
 
@@ -496,14 +1270,13 @@ class TelegramBot:
             if is_available:
                 keyboard.append([InlineKeyboardButton(
                     "🛒 Order This Item",
-                    callback_data=f"order_{shop_id}_{product_id}"
+                    callback_data=make_callback_data('order', shop_id, product_id)
                 )])
 
             # Back button - find the category
             category_name = product_data.get('category')
             if category_name:
                 # Find category ID by name
-                categories = await self.get_shop_categories(shop_id)
                 category_id = None
                 for cat in categories:
                     if cat['name'] == category_name:
@@ -511,55 +1284,61 @@ class TelegramBot:
                         break
 
                 if category_id:
-                    keyboard.append([InlineKeyboardButton("⬅️ Back to Products", callback_data=f"category_{shop_id}_{category_id}")])
+                    keyboard.append([InlineKeyboardButton("⬅️ Back to Products", callback_data=make_callback_data('category', shop_id, category_id))])
                 else:
-                    keyboard.append([InlineKeyboardButton("⬅️ Back to Categories", callback_data=f"shop_{shop_id}")])
+                    keyboard.append([back_to_categories_button(shop_id)])
             else:
-                keyboard.append([InlineKeyboardButton("⬅️ Back to Categories", callback_data=f"shop_{shop_id}")])
+                keyboard.append([back_to_categories_button(shop_id)])
 
             reply_markup = InlineKeyboardMarkup(keyboard)
 
             # Send with image if available
             if product_data.get('images') and len(product_data['images']) > 0:
-                await context.bot.send_photo(
+                image_url = product_data['images'][0]
+                # Telegram serves a known file_id directly instead of fetching the URL again
+                message = await context.bot.send_photo(
                     chat_id=chat_id,
-                    photo=product_data['images'][0],
+                    photo=self.photo_file_ids.get(image_url, image_url),
                     caption=text,
                     reply_markup=reply_markup,
-                    parse_mode='Markdown'
+                    parse_mode=PARSE_MARKDOWN
                 )
+                if message.photo:
+                    self.photo_file_ids.set(image_url, message.photo[-1].file_id)
             else:
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text=text,
                     reply_markup=reply_markup,
-                    parse_mode='Markdown'
+                    parse_mode=PARSE_MARKDOWN
                 )
 
         except Exception as e:
-            logger.error(f"Error sending product details: {e}")
+            logger.error("Error sending product details: %s", e)
             await context.bot.send_message(chat_id, "❌ Error loading product details.")
 
-    async def handle_order_request(self, chat_id: int, shop_id: str, product_id: str, user_id: int, context: ContextTypes.DEFAULT_TYPE):
+    async def handle_order_request(self, chat_id: int, shop_id: str, product_id: str, user_id: int, context: ContextTypes.DEFAULT_TYPE, user: Optional[User] = None):
         """Handle order request for a product"""
         try:
-            # Get product data
-            product_ref = self.db.collection('products').document(product_id)
-            product_doc = product_ref.get()
+            if user is None:
+                # Get product data and user chat concurrently
+                product_data, user = await asyncio.gather(
+                    self.get_product_data(product_id, fresh=True),
+                    context.bot.get_chat(user_id)
+                )
+            else:
+                # An order records price and availability, so it never trusts a cached copy
+                product_data = await self.get_product_data(product_id, fresh=True)
 
-            if not product_doc.exists:
+            if not product_data:
                 await context.bot.send_message(chat_id, "❌ Product not found.")
                 return
 
-            product_data = product_doc.to_dict()
-
             # Check if product is available
             if not product_data.get('isActive', True) or product_data.get('stock', 0) <= 0:
                 await context.bot.send_message(chat_id, "❌ This product is currently unavailable.")
                 return
 
-            # Get user data
-            user = await context.bot.get_chat(user_id)
             customer_name = f"{user.first_name} {user.last_name or ''}".strip()
 
             # Create order in Firebase
@@ -583,96 +1362,82 @@ class TelegramBot:
                 'source': 'telegram',
                 'status': 'pending',
                 'paymentStatus': 'pending',
-                'createdAt': datetime.now(timezone.utc),
-                'updatedAt': datetime.now(timezone.utc)
+                'createdAt': firestore.SERVER_TIMESTAMP,
+                'updatedAt': firestore.SERVER_TIMESTAMP
             }
 
             # Save order to Firebase
-            order_ref = self.db.collection('orders').add(order_data)
+            order_ref = await self.db.collection('orders').add(order_data)
             order_id = order_ref[1].id
 
             # Send confirmation to user
-            confirmation_text = f"✅ **Order Request Sent!**\n\n"
-            confirmation_text += f"🛍️ **Product:** {product_data['name']}\n"
-            confirmation_text += f"💰 **Price:** ${product_data['price']:.2f}\n"
-            confirmation_text += f"📋 **Order ID:** #{order_id[-6:]}\n\n"
-            confirmation_text += "📞 **Next Steps:**\n"
-            confirmation_text += "The shop owner will contact you shortly to confirm your order and arrange payment/delivery.\n\n"
-            confirmation_text += "Thank you for your order! 🙏"
-
-            keyboard = [[InlineKeyboardButton("⬅️ Back to Product", callback_data=f"product_{shop_id}_{product_id}")]]
+            confirmation_text = ORDER_CONFIRMATION_TEMPLATE.format(
+                product_name=product_data['name'],
+                price=product_data['price'],
+                short_order_id=order_id[-6:]
+            )
+
+            keyboard = [[InlineKeyboardButton("⬅️ Back to Product", callback_data=make_callback_data('product', shop_id, product_id))]]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=confirmation_text,
-                reply_markup=reply_markup,
-                parse_mode='Markdown'
+            # Confirm to the user and notify the shop owner/cashier concurrently
+            await asyncio.gather(
+                context.bot.send_message(
+                    chat_id=chat_id,
+                    text=confirmation_text,
+                    reply_markup=reply_markup,
+                    parse_mode=PARSE_MARKDOWN
+                ),
+                self.notify_shop_about_order(shop_id, order_data, order_id, context)
             )
 
-            # Send order notification to shop owner/cashier
-            await self.notify_shop_about_order(shop_id, order_data, order_id, context)
-
-            logger.info(f"Order created: {order_id} by user {user_id} for product {product_id}")
+            logger.info("Order created: %s by user %s for product %s", order_id, user_id, product_id)
 
         except Exception as e:
-            logger.error(f"Error handling order request: {e}")
+            logger.error("Error handling order request: %s", e)
             await context.bot.send_message(chat_id, "❌ Error processing order. Please try again.")
 
     async def notify_shop_about_order(self, shop_id: str, order_data: Dict, order_id: str, context: ContextTypes.DEFAULT_TYPE):
         """Notify shop about new order"""
         try:
             # Get cashier department for this shop
-            departments_ref = self.db.collection('departments').where('shopId', '==', shop_id).where('role', '==', 'cashier')
-            departments = departments_ref.stream()
-
-            cashier_chat_id = None
-            for dept in departments:
-                dept_data = dept.to_dict()
-                cashier_chat_id = dept_data.get('telegramChatId')
-                break
+            cashier_chat_id = self.get_department_chat_id(shop_id, 'cashier')
 
             if not cashier_chat_id:
-                logger.warning(f"No cashier department found for shop {shop_id}")
+                logger.warning("No cashier department found for shop %s", shop_id)
                 return
 
             # Create order notification message
             items_list = []
             for item in order_data['items']:
-                items_list.append(f"• {item['productName']} × {item['quantity']} = ${item['total']:.2f}")
+                items_list.append(f"• {html.escape(item['productName'])} × {item['quantity']} = ${item['total']:.2f}")
 
             items_text = '\n'.join(items_list)
 
-            message = f"""
-🛍️ <b>New Telegram Order</b>
-
-📋 Order ID: #{order_id[-6:]}
-👤 Customer: {order_data['customerName']}
-📱 Telegram: @{order_data.get('telegramUsername', 'N/A')}
-🆔 User ID: {order_data['telegramId']}
-💰 Total: ${order_data['total']:.2f}
-🚚 Method: {order_data['deliveryMethod'].title()}
-💳 Payment: {order_data['paymentPreference'].title()}
-
-📦 <b>Items:</b>
-{items_text}
-
-⏰ Ordered: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-
-<i>Please approve or reject this order</i>
-            """.strip()
+            # User-supplied names are escaped so they cannot break the HTML parse
+            message = ORDER_NOTIFICATION_TEMPLATE.format(
+                short_order_id=order_id[-6:],
+                customer_name=html.escape(order_data['customerName']),
+                telegram_username=html.escape(order_data.get('telegramUsername') or 'N/A'),
+                telegram_id=order_data['telegramId'],
+                total=order_data['total'],
+                delivery_method=order_data['deliveryMethod'].title(),
+                payment_preference=order_data['paymentPreference'].title(),
+                items_text=items_text,
+                ordered_at=datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            )
 
             # Send notification to cashier
             await context.bot.send_message(
                 chat_id=cashier_chat_id,
                 text=message,
-                parse_mode='HTML'
+                parse_mode=PARSE_HTML
             )
 
-            logger.info(f"Order notification sent to cashier chat {cashier_chat_id}")
+            logger.info("Order notification sent to cashier chat %s", cashier_chat_id)
 
         except Exception as e:
-            logger.error(f"Error notifying shop about order: {e}")
+            logger.error("Error notifying shop about order: %s", e)
 
     async def handle_add_category(self, chat_id: int, shop_id: str, user_id: int, context: ContextTypes.DEFAULT_TYPE):
         """Handle add category request"""
@@ -694,18 +1459,18 @@ class TelegramBot:
             text = "➕ **Add New Category**\n\n"
             text += "📝 Please send the category name:"
 
-            keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data=f"shop_{shop_id}")]]
+            keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data=make_callback_data('shop', shop_id))]]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
             await context.bot.send_message(
                 chat_id=chat_id,
                 text=text,
                 reply_markup=reply_markup,
-                parse_mode='Markdown'
+                parse_mode=PARSE_MARKDOWN
             )
 
         except Exception as e:
-            logger.error(f"Error handling add category: {e}")
+            logger.error("Error handling add category: %s", e)
             await context.bot.send_message(chat_id, "❌ Error starting category creation.")
 
     async def handle_add_product(self, chat_id: int, shop_id: str, user_id: int, context: ContextTypes.DEFAULT_TYPE, category_id: str = None):
@@ -728,8 +1493,8 @@ class TelegramBot:
                 text += "Would you like to create a category first?"
 
                 keyboard = [
-                    [InlineKeyboardButton("➕ Create Category", callback_data=f"add_category_{shop_id}")],
-                    [InlineKeyboardButton("⬅️ Back", callback_data=f"shop_{shop_id}")]
+                    [InlineKeyboardButton("➕ Create Category", callback_data=make_callback_data('add_category', shop_id))],
+                    [InlineKeyboardButton("⬅️ Back", callback_data=make_callback_data('shop', shop_id))]
                 ]
                 reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -737,7 +1502,7 @@ class TelegramBot:
                     chat_id=chat_id,
                     text=text,
                     reply_markup=reply_markup,
-                    parse_mode='Markdown'
+                    parse_mode=PARSE_MARKDOWN
                 )
                 return
 
@@ -773,32 +1538,32 @@ class TelegramBot:
                 for category in categories:
                     keyboard.append([InlineKeyboardButton(
                         f"{category.get('icon', '📦')} {category['name']}", 
-                        callback_data=f"add_product_category_{shop_id}_{category['id']}"
+                        callback_data=make_callback_data('add_product_category', shop_id, category['id'])
                     )])
 
-                keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data=f"shop_{shop_id}")])
+                keyboard.append([InlineKeyboardButton("⬅️ Back", callback_data=make_callback_data('shop', shop_id))])
                 reply_markup = InlineKeyboardMarkup(keyboard)
 
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text=text,
                     reply_markup=reply_markup,
-                    parse_mode='Markdown'
+                    parse_mode=PARSE_MARKDOWN
                 )
                 return
 
-            keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data=f"shop_{shop_id}")]]
+            keyboard = [[InlineKeyboardButton("❌ Cancel", callback_data=make_callback_data('shop', shop_id))]]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
             await context.bot.send_message(
                 chat_id=chat_id,
                 text=text,
                 reply_markup=reply_markup,
-                parse_mode='Markdown'
+                parse_mode=PARSE_MARKDOWN
             )
 
         except Exception as e:
-            logger.error(f"Error handling add product: {e}")
+            logger.error("Error handling add product: %s", e)
             await context.bot.send_message(chat_id, "❌ Error starting product creation.")
 
     async def handle_text_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -840,14 +1605,13 @@ class TelegramBot:
                 response_text = f"✅ Category name: **{text}**\n\n"
                 response_text += "📝 Please send a description for this category (or send 'skip' to skip):"
 
-                keyboard = [[InlineKeyboardButton("⏭️ Skip Description", callback_data=f"skip_category_desc_{shop_id}")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = skip_step_markup('skip_category_desc', shop_id)
 
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text=response_text,
                     reply_markup=reply_markup,
-                    parse_mode='Markdown'
+                    parse_mode=PARSE_MARKDOWN
                 )
 
             elif step == 'description':
@@ -864,16 +1628,15 @@ class TelegramBot:
                 else:
                     response_text += "\n"
 
-                response_text += "🎨 Please send an emoji icon for this category (or send 'skip' for default 📦):"
+                response_text += CATEGORY_ICON_PROMPT_TEXT
 
-                keyboard = [[InlineKeyboardButton("📦 Use Default Icon", callback_data=f"skip_category_icon_{shop_id}")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = skip_step_markup('skip_category_icon', shop_id)
 
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text=response_text,
                     reply_markup=reply_markup,
-                    parse_mode='Markdown'
+                    parse_mode=PARSE_MARKDOWN
                 )
 
             elif step == 'icon':
@@ -886,7 +1649,7 @@ class TelegramBot:
                 await self.create_category(chat_id, user_id, session_data, context)
 
         except Exception as e:
-            logger.error(f"Error processing category creation: {e}")
+            logger.error("Error processing category creation: %s", e)
             await context.bot.send_message(chat_id, "❌ Error creating category. Please try again.")
             self.user_cache.clear_user_session(user_id, 'adding_category')
 
@@ -905,14 +1668,13 @@ class TelegramBot:
                 response_text = f"✅ Product name: **{text}**\n\n"
                 response_text += "📝 Please send a description for this product (or send 'skip' to skip):"
 
-                keyboard = [[InlineKeyboardButton("⏭️ Skip Description", callback_data=f"skip_product_desc_{shop_id}")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
+                reply_markup = skip_step_markup('skip_product_desc', shop_id)
 
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text=response_text,
                     reply_markup=reply_markup,
-                    parse_mode='Markdown'
+                    parse_mode=PARSE_MARKDOWN
                 )
 
             elif step == 'description':
@@ -929,69 +1691,70 @@ class TelegramBot:
                 else:
                     response_text += "\n"
 
-                response_text += "💰 Please send the price (numbers only, e.g., 25.99):"
+                response_text += PRODUCT_PRICE_PROMPT_TEXT
 
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text=response_text,
-                    parse_mode='Markdown'
+                    parse_mode=PARSE_MARKDOWN
                 )
 
             elif step == 'price':
                 # Validate and store price, ask for stock
-                try:
-                    price = float(text)
-                    if price <= 0:
-                        raise ValueError("Price must be positive")
-
-                    session_data['price'] = price
-                    session_data['step'] = 'stock'
-                    self.user_cache.set_user_session(user_id, 'adding_product', session_data)
-
-                    response_text = f"✅ Product: **{session_data['name']}**\n"
-                    response_text += f"💰 Price: ${price:.2f}\n\n"
-                    response_text += "📦 Please send the stock quantity (whole numbers only, e.g., 50):"
-
-                    await context.bot.send_message(
-                        chat_id=chat_id,
-                        text=response_text,
-                        parse_mode='Markdown'
-                    )
-
-                except ValueError:
+                price = float(text) if PRICE_PATTERN.fullmatch(text) else 0.0
+                if not (math.isfinite(price) and 0 < price <= MAX_PRODUCT_PRICE):
                     await context.bot.send_message(
                         chat_id=chat_id,
                         text="❌ Invalid price. Please send a valid number (e.g., 25.99):"
                     )
+                    return
 
-            elif step == 'stock':
-                # Validate and store stock, create product
-                try:
-                    stock = int(text)
-                    if stock < 0:
-                        raise ValueError("Stock cannot be negative")
+                session_data['price'] = price
+                session_data['step'] = 'stock'
+                self.user_cache.set_user_session(user_id, 'adding_product', session_data)
 
-                    session_data['stock'] = stock
-                    await self.create_product(chat_id, user_id, session_data, context)
+                response_text = f"✅ Product: **{session_data['name']}**\n"
+                response_text += f"💰 Price: ${price:.2f}\n\n"
+                response_text += "📦 Please send the stock quantity (whole numbers only, e.g., 50):"
 
-                except ValueError:
+                await context.bot.send_message(
+                    chat_id=chat_id,
+                    text=response_text,
+                    parse_mode=PARSE_MARKDOWN
+                )
+
+            elif step == 'stock':
+                # Validate and store stock, create product
+                if not STOCK_PATTERN.fullmatch(text):
                     await context.bot.send_message(
                         chat_id=chat_id,
                         text="❌ Invalid stock quantity. Please send a whole number (e.g., 50):"
                     )
+                    return
+
+                session_data['stock'] = int(text)
+                await self.create_product(chat_id, user_id, session_data, context)
 
         except Exception as e:
-            logger.error(f"Error processing product creation: {e}")
+            logger.error("Error processing product creation: %s", e)
             await context.bot.send_message(chat_id, "❌ Error creating product. Please try again.")
             self.user_cache.clear_user_session(user_id, 'adding_product')
 
+    def format_description_line(self, session_data: Dict) -> str:
+        """Get the success-message description line, or nothing when no description was given"""
+        description = session_data.get('description')
+        return DESCRIPTION_LINE_TEMPLATE.format(description) if description else ''
+
     async def create_category(self, chat_id: int, user_id: int, session_data: Dict, context: ContextTypes.DEFAULT_TYPE):
         """Create category in Firebase"""
         try:
             shop_id = session_data['shop_id']
 
-            # Get next order number
-            categories = await self.get_shop_categories(shop_id)
+            # Get next order number and the creator's Firebase UID concurrently
+            categories, firebase_uid = await asyncio.gather(
+                self.get_shop_categories(shop_id),
+                self.get_user_firebase_uid(user_id)
+            )
             next_order = len(categories)
 
             # Create category document
@@ -1001,28 +1764,28 @@ class TelegramBot:
                 'icon': session_data.get('icon', '📦'),
                 'order': next_order,
                 'shopId': shop_id,
-                'userId': await self.get_user_firebase_uid(user_id),
-                'createdAt': datetime.now(timezone.utc),
-                'updatedAt': datetime.now(timezone.utc)
+                'userId': firebase_uid,
+                'createdAt': firestore.SERVER_TIMESTAMP,
+                'updatedAt': firestore.SERVER_TIMESTAMP
             }
 
             # Add to Firebase
-            doc_ref = self.db.collection('categories').add(category_data)
+            doc_ref = await self.db.collection('categories').add(category_data)
+            self.invalidate_shop_categories(shop_id)
 
             # Clear session
             self.user_cache.clear_user_session(user_id, 'adding_category')
 
             # Send success message
-            text = f"✅ **Category Created Successfully!**\n\n"
-            text += f"📂 **Name:** {session_data['name']}\n"
-            text += f"🎨 **Icon:** {session_data.get('icon', '📦')}\n"
-            if session_data.get('description'):
-                text += f"📝 **Description:** {session_data['description']}\n"
-            text += f"\n🎉 Category is now available in your shop!"
+            text = CATEGORY_CREATED_TEMPLATE.format(
+                name=session_data['name'],
+                icon=session_data.get('icon', '📦'),
+                description_line=self.format_description_line(session_data)
+            )
 
             keyboard = [
-                [InlineKeyboardButton("➕ Add Product to Category", callback_data=f"add_product_category_{shop_id}_{doc_ref[1].id}")],
-                [InlineKeyboardButton("🏪 Back to Shop", callback_data=f"shop_{shop_id}")]
+                [InlineKeyboardButton("➕ Add Product to Category", callback_data=make_callback_data('add_product_category', shop_id, doc_ref[1].id))],
+                [shop_home_button(shop_id)]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -1030,11 +1793,11 @@ class TelegramBot:
                 chat_id=chat_id,
                 text=text,
                 reply_markup=reply_markup,
-                parse_mode='Markdown'
+                parse_mode=PARSE_MARKDOWN
             )
 
         except Exception as e:
-            logger.error(f"Error creating category: {e}")
+            logger.error("Error creating category: %s", e)
             await context.bot.send_message(chat_id, "❌ Error creating category. Please try again.")
             self.user_cache.clear_user_session(user_id, 'adding_category')
 
@@ -1050,36 +1813,37 @@ class TelegramBot:
                 'price': session_data['price'],
                 'stock': session_data['stock'],
                 'category': session_data['category_name'],
+                'categoryId': session_data['category_id'],
                 'subcategory': '',
                 'images': [],
                 'sku': '',
                 'isActive': True,
                 'lowStockAlert': 5,
                 'shopId': shop_id,
-                'createdAt': datetime.now(timezone.utc),
-                'updatedAt': datetime.now(timezone.utc)
+                'createdAt': firestore.SERVER_TIMESTAMP,
+                'updatedAt': firestore.SERVER_TIMESTAMP
             }
 
             # Add to Firebase
-            doc_ref = self.db.collection('products').add(product_data)
+            doc_ref = await self.db.collection('products').add(product_data)
+            self.category_products_cache.pop((shop_id, session_data['category_id'], None))
 
             # Clear session
             self.user_cache.clear_user_session(user_id, 'adding_product')
 
             # Send success message
-            text = f"✅ **Product Created Successfully!**\n\n"
-            text += f"🛍️ **Name:** {session_data['name']}\n"
-            text += f"📂 **Category:** {session_data['category_name']}\n"
-            text += f"💰 **Price:** ${session_data['price']:.2f}\n"
-            text += f"📦 **Stock:** {session_data['stock']}\n"
-            if session_data.get('description'):
-                text += f"📝 **Description:** {session_data['description']}\n"
-            text += f"\n🎉 Product is now available in your shop!"
+            text = PRODUCT_CREATED_TEMPLATE.format(
+                name=session_data['name'],
+                category_name=session_data['category_name'],
+                price=session_data['price'],
+                stock=session_data['stock'],
+                description_line=self.format_description_line(session_data)
+            )
 
             keyboard = [
-                [InlineKeyboardButton("➕ Add Another Product", callback_data=f"add_product_{shop_id}")],
-                [InlineKeyboardButton("📂 View Category", callback_data=f"category_{shop_id}_{session_data['category_id']}")],
-                [InlineKeyboardButton("🏪 Back to Shop", callback_data=f"shop_{shop_id}")]
+                [add_another_product_button(shop_id)],
+                [InlineKeyboardButton("📂 View Category", callback_data=make_callback_data('category', shop_id, session_data['category_id']))],
+                [shop_home_button(shop_id)]
             ]
             reply_markup = InlineKeyboardMarkup(keyboard)
 
@@ -1087,27 +1851,33 @@ class TelegramBot:
                 chat_id=chat_id,
                 text=text,
                 reply_markup=reply_markup,
-                parse_mode='Markdown'
+                parse_mode=PARSE_MARKDOWN
             )
 
         except Exception as e:
-            logger.error(f"Error creating product: {e}")
+            logger.error("Error creating product: %s", e)
             await context.bot.send_message(chat_id, "❌ Error creating product. Please try again.")
             self.user_cache.clear_user_session(user_id, 'adding_product')
 
     async def get_user_firebase_uid(self, telegram_id: int) -> str:
         """Get Firebase UID for telegram user"""
+        # Linked UIDs are briefly cached; unlinked users fall back to their Telegram ID
+        cached_uid = self.firebase_uid_cache.get(telegram_id)
+        if cached_uid:
+            return cached_uid
+
         try:
             user_ref = self.db.collection('users').document(str(telegram_id))
-            user_doc = user_ref.get()
+            user_doc = await user_ref.get()
 
-            if user_doc.exists:
-                user_data = user_doc.to_dict()
-                return user_data.get('firebase_uid', str(telegram_id))
+            firebase_uid = user_doc.to_dict().get('firebase_uid') if user_doc.exists else None
+            if not firebase_uid:
+                return str(telegram_id)
 
-            return str(telegram_id)
+            self.firebase_uid_cache.set(telegram_id, firebase_uid)
+            return firebase_uid
         except Exception as e:
-            logger.error(f"Error getting user Firebase UID: {e}")
+            logger.error("Error getting user Firebase UID: %s", e)
             return str(telegram_id)
 
     async def handle_shop_stats(self, chat_id: int, shop_id: str, user_id: int, context: ContextTypes.DEFAULT_TYPE):
@@ -1132,25 +1902,24 @@ class TelegramBot:
             text += f"📦 Total Orders: {orders_count}\n"
             text += f"📅 Generated: {datetime.now().strftime('%Y-%m-%d %H:%M')}"
 
-            keyboard = [[InlineKeyboardButton("⬅️ Back to Shop", callback_data=f"shop_{shop_id}")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            reply_markup = back_to_shop_markup(shop_id)
 
             await context.bot.send_message(
                 chat_id=chat_id,
                 text=text,
                 reply_markup=reply_markup,
-                parse_mode='Markdown'
+                parse_mode=PARSE_MARKDOWN
             )
 
         except Exception as e:
-            logger.error(f"Error handling shop stats: {e}")
+            logger.error("Error handling shop stats: %s", e)
             await context.bot.send_message(chat_id, "❌ Error loading shop statistics.")
 
     async def get_shop_products(self, shop_id: str) -> List[Dict]:
         """Get all products for a shop"""
         try:
             products_ref = self.db.collection('products').where('shopId', '==', shop_id)
-            products = products_ref.stream()
+            products = await products_ref.get()
 
             product_list = []
             for product in products:
@@ -1161,19 +1930,19 @@ class TelegramBot:
             return product_list
 
         except Exception as e:
-            logger.error(f"Error getting shop products: {e}")
+            logger.error("Error getting shop products: %s", e)
             return []
 
     async def get_shop_orders_count(self, shop_id: str) -> int:
         """Get total orders count for a shop"""
         try:
             orders_ref = self.db.collection('orders').where('shopId', '==', shop_id)
-            orders = orders_ref.stream()
+            orders = await orders_ref.get()
 
-            return len(list(orders))
+            return len(orders)
 
         except Exception as e:
-            logger.error(f"Error getting shop orders count: {e}")
+            logger.error("Error getting shop orders count: %s", e)
             return 0
 
     async def handle_shop_settings(self, chat_id: int, shop_id: str, user_id: int, context: ContextTypes.DEFAULT_TYPE):
@@ -1197,128 +1966,278 @@ class TelegramBot:
         await self.load_shop_owners()
 
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle button callbacks"""
+        """Queue button callbacks for their chat's worker and acknowledge them"""
         query = update.callback_query
-        await query.answer()
+        chat_id = update.effective_chat.id
 
+        # Queue before awaiting anything, so updates reach the chat worker in arrival order
+        parsed = parse_callback_data(query.data)
+        if parsed:
+            action, args = parsed
+            accepted = self.dispatch_to_chat(chat_id, partial(self.process_callback, update, context, action, args))
+            if accepted and action in NAVIGATION_ACTIONS:
+                # Per user, so in a group one member's click never cancels another's screen.
+                # Keep the newest click even if an older one is recorded after it; a refused one never supersedes
+                navigation_key = (chat_id, update.effective_user.id)
+                latest = self.latest_navigation.get(navigation_key)
+                if latest is None or update.update_id > latest:
+                    self.latest_navigation.set(navigation_key, update.update_id)
+        else:
+            accepted = True
+
+        # Answering only stops the button spinner, so it does not hold up the queue
+        task = asyncio.create_task(self.answer_callback_query(query))
+        self.callback_answer_tasks.add(task)
+        task.add_done_callback(self.callback_answer_tasks.discard)
+
+        if not accepted:
+            await self.reply_chat_busy(chat_id, context)
+
+    async def answer_callback_query(self, query):
+        """Acknowledge a button press"""
+        try:
+            await query.answer()
+        except Exception as e:
+            # An expired or already-answered query still deserves its screen
+            logger.debug("Could not answer callback query %s: %s", query.id, e)
+
+    def for_chat(self, handler):
+        """Wrap an update handler so it runs on its chat's worker"""
+        async def enqueue(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            chat_id = update.effective_chat.id
+            if not self.dispatch_to_chat(chat_id, partial(handler, update, context)):
+                await self.reply_chat_busy(chat_id, context)
+        return enqueue
+
+    def dispatch_to_chat(self, chat_id: int, job) -> bool:
+        """Queue a job behind earlier updates from the same chat; False if the chat's queue is full"""
+        queue = self.chat_queues.get(chat_id)
+        if queue is None:
+            queue = self.chat_queues[chat_id] = deque()
+            self.chat_workers[chat_id] = asyncio.create_task(self.run_chat_worker(chat_id, queue))
+        elif len(queue) >= CHAT_QUEUE_SIZE:
+            # Refuse the newest update rather than dropping one that was already acknowledged
+            logger.warning("Chat %s has %d queued updates; refusing a new one", chat_id, len(queue))
+            return False
+        queue.append(job)
+        return True
+
+    async def reply_chat_busy(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE):
+        """Tell a chat that its update was refused because its queue is full"""
+        try:
+            await context.bot.send_message(chat_id, CHAT_BUSY_TEXT)
+        except Exception as e:
+            logger.debug("Could not send busy reply to chat %s: %s", chat_id, e)
+
+    async def run_chat_worker(self, chat_id: int, queue: deque):
+        """Run a chat's queued jobs one at a time, then exit once the chat is idle"""
+        try:
+            while queue:
+                job = queue.popleft()
+                async with self.chat_worker_slots:
+                    try:
+                        await job()
+                    except Exception as e:
+                        logger.error("Error processing update for chat %s: %s", chat_id, e)
+        finally:
+            # Nothing awaits between the empty check and here, so no job can be stranded
+            del self.chat_queues[chat_id]
+            del self.chat_workers[chat_id]
+
+    async def process_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE, action: str, args: Tuple[str, ...]):
+        """Run the handler for a parsed button callback"""
         user_id = update.effective_user.id
         chat_id = update.effective_chat.id
-        data = query.data
+
+        # Skip a screen the user has already navigated away from
+        if action in NAVIGATION_ACTIONS and self.latest_navigation.get((chat_id, user_id)) != update.update_id:
+            return
 
         try:
-            if data == "refresh_shops":
-                await self.send_welcome_message(chat_id, update.effective_user.first_name, context)
-
-            elif data.startswith("shop_"):
-                shop_id = data.split("_", 1)[1]
-                shop_data = await self.get_shop_data(shop_id)
-                if shop_data:
-                    await self.send_shop_menu(chat_id, shop_data, user_id, context)
-                else:
-                    await context.bot.send_message(chat_id, "❌ Shop not found.")
-
-            elif data.startswith("category_"):
-                parts = data.split("_")
-                if len(parts) >= 3:
-                    shop_id = parts[1]
-                    category_id = parts[2]
-                    await self.send_category_products(chat_id, shop_id, category_id, user_id, context)
-
-            elif data.startswith("product_"):
-                parts = data.split("_")
-                if len(parts) >= 3:
-                    shop_id = parts[1]
-                    product_id = parts[2]
-                    await self.send_product_details(chat_id, shop_id, product_id, user_id, context)
-
-            elif data.startswith("order_"):
-                parts = data.split("_")
-                if len(parts) >= 3:
-                    shop_id = parts[1]
-                    product_id = parts[2]
-                    await self.handle_order_request(chat_id, shop_id, product_id, user_id, context)
-
-            elif data.startswith("add_category_"):
-                shop_id = data.split("_", 2)[2]
-                await self.handle_add_category(chat_id, shop_id, user_id, context)
-
-            elif data.startswith("add_product_category_"):
-                parts = data.split("_")
-                if len(parts) >= 4:
-                    shop_id = parts[3]
-                    category_id = parts[4]
-                    await self.handle_add_product(chat_id, shop_id, user_id, context, category_id)
-
-            elif data.startswith("add_product_"):
-                shop_id = data.split("_", 2)[2]
-                await self.handle_add_product(chat_id, shop_id, user_id, context)
-
-            elif data.startswith("shop_stats_"):
-                shop_id = data.split("_", 2)[2]
-                await self.handle_shop_stats(chat_id, shop_id, user_id, context)
-
-            elif data.startswith("shop_settings_"):
-                shop_id = data.split("_", 2)[2]
-                await self.handle_shop_settings(chat_id, shop_id, user_id, context)
-
-            elif data.startswith("manage_staff_"):
-                shop_id = data.split("_", 2)[2]
-                await self.handle_manage_staff(chat_id, shop_id, user_id, context)
-
-            elif data.startswith("view_analytics_"):
-                shop_id = data.split("_", 2)[2]
-                await self.handle_view_analytics(chat_id, shop_id, user_id, context)
-
-            elif data.startswith("send_announcement_"):
-                shop_id = data.split("_", 2)[2]
-                await self.handle_send_announcement(chat_id, shop_id, user_id, context)
-
-            elif data.startswith("skip_category_desc_"):
-                shop_id = data.split("_", 3)[3]
-                adding_category = self.user_cache.get_user_session(user_id, 'adding_category')
-                if adding_category:
-                    adding_category['step'] = 'icon'
-                    self.user_cache.set_user_session(user_id, 'adding_category', adding_category)
-
-                    response_text = f"✅ Category: **{adding_category['name']}**\n\n"
-                    response_text += "🎨 Please send an emoji icon for this category (or send 'skip' for default 📦):"
-
-                    keyboard = [[InlineKeyboardButton("📦 Use Default Icon", callback_data=f"skip_category_icon_{shop_id}")]]
-                    reply_markup = InlineKeyboardMarkup(keyboard)
+            await self.callback_handlers[action](update, context, chat_id, user_id, *args)
 
-                    await context.bot.send_message(
-                        chat_id=chat_id,
-                        text=response_text,
-                        reply_markup=reply_markup,
-                        parse_mode='Markdown'
-                    )
+        except Exception as e:
+            logger.error("Error handling button callback: %s", e)
+            await context.bot.send_message(chat_id, "❌ Error processing request. Please try again.")
 
-            elif data.startswith("skip_category_icon_"):
-                shop_id = data.split("_", 3)[3]
-                adding_category = self.user_cache.get_user_session(user_id, 'adding_category')
-                if adding_category:
-                    adding_category['icon'] = '📦'
-                    await self.create_category(chat_id, user_id, adding_category, context)
+    async def on_refresh_shops(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int):
+        """Handle refresh_shops button"""
+        await self.send_welcome_message(chat_id, update.effective_user.first_name, context)
 
-            elif data.startswith("skip_product_desc_"):
-                shop_id = data.split("_", 3)[3]
-                adding_product = self.user_cache.get_user_session(user_id, 'adding_product')
-                if adding_product:
-                    adding_product['step'] = 'price'
-                    self.user_cache.set_user_session(user_id, 'adding_product', adding_product)
+    async def on_shops_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, page: str):
+        """Handle shops_page_{page} button"""
+        try:
+            page_number = int(page)
+        except ValueError:
+            page_number = 0
+        await self.send_welcome_message(chat_id, update.effective_user.first_name, context, page_number)
+
+    async def on_shop(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str):
+        """Handle shop_{shop_id} button"""
+        # Prefetch the categories alongside the shop; send_shop_menu then reads them from cache
+        shop_data, _ = await asyncio.gather(
+            self.get_shop_data(shop_id),
+            self.get_shop_categories(shop_id)
+        )
+        if shop_data:
+            await self.send_shop_menu(chat_id, shop_data, user_id, context)
+        else:
+            await context.bot.send_message(chat_id, "❌ Shop not found.")
+
+    async def on_category(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str, category_id: str):
+        """Handle category_{shop_id}_{category_id} button"""
+        await self.send_category_products(chat_id, shop_id, category_id, user_id, context)
+
+    async def on_category_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int,
+                               category_id: str, stock: str, product_id: str):
+        """Handle category_page_{category_id}_{stock}_{product_id} button"""
+        category_data = await self.get_category_data(category_id)
+        if not category_data or not category_data.get('shopId'):
+            await context.bot.send_message(chat_id, "❌ Category not found.")
+            return
 
-                    response_text = f"✅ Product: **{adding_product['name']}**\n\n"
-                    response_text += "💰 Please send the price (numbers only, e.g., 25.99):"
+        try:
+            stock_value = int(stock)
+        except ValueError:
+            stock_value = float(stock)
+        await self.send_category_products(chat_id, category_data['shopId'], category_id, user_id, context, (stock_value, product_id))
+
+    async def on_product(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str, product_id: str):
+        """Handle product_{shop_id}_{product_id} button"""
+        await self.send_product_details(chat_id, shop_id, product_id, user_id, context)
+
+    async def on_order(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str, product_id: str):
+        """Handle order_{shop_id}_{product_id} button"""
+        # The clicking user is already on the update, so no get_chat round trip is needed
+        await self.handle_order_request(chat_id, shop_id, product_id, user_id, context, update.effective_user)
+
+    async def on_add_category(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str):
+        """Handle add_category_{shop_id} button"""
+        await self.handle_add_category(chat_id, shop_id, user_id, context)
+
+    async def on_add_product_category(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str, category_id: str):
+        """Handle add_product_category_{shop_id}_{category_id} button"""
+        await self.handle_add_product(chat_id, shop_id, user_id, context, category_id)
+
+    async def on_add_product(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str):
+        """Handle add_product_{shop_id} button"""
+        await self.handle_add_product(chat_id, shop_id, user_id, context)
+
+    async def on_shop_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str):
+        """Handle shop_stats_{shop_id} button"""
+        await self.handle_shop_stats(chat_id, shop_id, user_id, context)
+
+    async def on_shop_settings(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str):
+        """Handle shop_settings_{shop_id} button"""
+        await self.handle_shop_settings(chat_id, shop_id, user_id, context)
+
+    async def on_manage_staff(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str):
+        """Handle manage_staff_{shop_id} button"""
+        await self.handle_manage_staff(chat_id, shop_id, user_id, context)
+
+    async def on_view_analytics(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str):
+        """Handle view_analytics_{shop_id} button"""
+        await self.handle_view_analytics(chat_id, shop_id, user_id, context)
+
+    async def on_send_announcement(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str):
+        """Handle send_announcement_{shop_id} button"""
+        await self.handle_send_announcement(chat_id, shop_id, user_id, context)
+
+    async def on_skip_category_desc(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str):
+        """Handle skip_category_desc_{shop_id} button"""
+        adding_category = self.user_cache.get_user_session(user_id, 'adding_category')
+        if adding_category:
+            adding_category['step'] = 'icon'
+            self.user_cache.set_user_session(user_id, 'adding_category', adding_category)
 
-                    await context.bot.send_message(
-                        chat_id=chat_id,
-                        text=response_text,
-                        parse_mode='Markdown'
-                    )
+            response_text = f"✅ Category: **{adding_category['name']}**\n\n"
+            response_text += CATEGORY_ICON_PROMPT_TEXT
 
-        except Exception as e:
-            logger.error(f"Error handling button callback: {e}")
-            await context.bot.send_message(chat_id, "❌ Error processing request. Please try again.")
+            reply_markup = skip_step_markup('skip_category_icon', shop_id)
+
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=response_text,
+                reply_markup=reply_markup,
+                parse_mode=PARSE_MARKDOWN
+            )
+
+    async def on_skip_category_icon(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str):
+        """Handle skip_category_icon_{shop_id} button"""
+        adding_category = self.user_cache.get_user_session(user_id, 'adding_category')
+        if adding_category:
+            adding_category['icon'] = '📦'
+            await self.create_category(chat_id, user_id, adding_category, context)
+
+    async def on_skip_product_desc(self, update: Update, context: ContextTypes.DEFAULT_TYPE, chat_id: int, user_id: int, shop_id: str):
+        """Handle skip_product_desc_{shop_id} button"""
+        adding_product = self.user_cache.get_user_session(user_id, 'adding_product')
+        if adding_product:
+            adding_product['step'] = 'price'
+            self.user_cache.set_user_session(user_id, 'adding_product', adding_product)
+
+            response_text = f"✅ Product: **{adding_product['name']}**\n\n"
+            response_text += PRODUCT_PRICE_PROMPT_TEXT
+
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=response_text,
+                parse_mode=PARSE_MARKDOWN
+            )
+
+    def start_background_tasks(self):
+        """Start the user-document writer, the cache sweeper and the shop refresher"""
+        self.user_writer_task = asyncio.create_task(self.run_user_writer())
+        self.cache_sweeper_task = asyncio.create_task(self.run_cache_sweeper())
+        self.shop_refresher_task = asyncio.create_task(self.run_shop_refresher())
+
+    async def run_shop_refresher(self):
+        """Reload the active shops while they are in use, so /start and shop clicks rarely wait on them"""
+        while True:
+            await asyncio.sleep(SHOP_REFRESH_INTERVAL)
+            # An idle bot costs no reads; the next lookup loads the list on demand
+            if not self.active_shops_used:
+                continue
+            self.active_shops_used = False
+            try:
+                await self.get_active_shops(refresh=True)
+            except Exception as e:
+                logger.warning("Background shop refresh failed: %s", e)
+
+    async def run_cache_sweeper(self):
+        """Periodically purge expired entries that lookups have not touched"""
+        caches = (
+            self.shop_cache, self.active_shops_cache, self.category_cache, self.product_cache,
+            self.categories_by_shop_cache, self.category_products_cache, self.menu_cache,
+            self.category_view_cache, self.ownership_cache, self.firebase_uid_cache, self.photo_file_ids,
+            self.persisted_interactions, self.latest_navigation
+        )
+        while True:
+            await asyncio.sleep(CACHE_SWEEP_INTERVAL)
+            removed = self.user_cache.purge_expired() + sum(cache.purge_expired() for cache in caches)
+            if removed:
+                logger.debug("Purged %d expired cache entries", removed)
+
+    async def drain_chat_workers(self):
+        """Let already-acknowledged updates finish while the bot can still send replies"""
+        if self.chat_workers:
+            _, unfinished = await asyncio.wait(list(self.chat_workers.values()), timeout=CALLBACK_DRAIN_TIMEOUT)
+            if unfinished:
+                logger.warning("Dropping queued updates for %d chats at shutdown", len(unfinished))
+            for task in unfinished:
+                task.cancel()
+
+    async def stop_background_tasks(self):
+        """Stop background tasks and flush writes that are still queued"""
+        if self.user_writer_task:
+            self.user_writer_task.cancel()
+        if self.cache_sweeper_task:
+            self.cache_sweeper_task.cancel()
+        if self.shop_refresher_task:
+            self.shop_refresher_task.cancel()
+        if self.department_watch:
+            self.department_watch.unsubscribe()
+        await self.flush_user_writes()
 
     async def setup_bot_commands(self, application):
         """Setup bot commands"""
@@ -1333,29 +2252,68 @@ class TelegramBot:
         """Run the bot"""
         try:
             # Create application
-            application = Application.builder().token(self.bot_token).build()
+            # Updates are handled concurrently; per-chat ordering comes from dispatch_to_chat.
+            # The rate limiter queues sends to stay within Telegram's flood limits instead of failing them.
+            application = (
+                Application.builder()
+                .token(self.bot_token)
+                .concurrent_updates(True)
+                .rate_limiter(AIORateLimiter(max_retries=RATE_LIMIT_MAX_RETRIES))
+                .build()
+            )
 
             # Add handlers
-            application.add_handler(CommandHandler("start", self.start_command))
+            application.add_handler(CommandHandler("start", self.for_chat(self.start_command)))
             application.add_handler(CallbackQueryHandler(self.button_callback))
-            application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_text_message))
+            application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.for_chat(self.handle_text_message)))
 
             # Setup post_init callback to load shop owners
             async def post_init(application):
+                await self.warm_up_firestore()
                 await self.load_shop_owners()
+                self.start_department_listener()
+                self.start_background_tasks()
                 await self.setup_bot_commands(application)
                 logger.info("🤖 Multi-Shop Telegram Bot started successfully!")
                 logger.info("📱 Bot will handle user caching and shop navigation")
                 logger.info("🛒 Order processing is now enabled")
                 logger.info("🔄 Press Ctrl+C to stop the bot")
             
+            # Finish queued updates after polling stops, before PTB shuts the bot's HTTP client down
+            async def post_stop(application):
+                await self.drain_chat_workers()
+
+            # Flush queued writes before the bot exits
+            async def post_shutdown(application):
+                await self.stop_background_tasks()
+
             application.post_init = post_init
+            application.post_stop = post_stop
+            application.post_shutdown = post_shutdown
 
             # Run the bot - let it handle its own event loop
-            application.run_polling(allowed_updates=Update.ALL_TYPES)
+            webhook_url = os.getenv('TELEGRAM_WEBHOOK_URL')
+            if webhook_url:
+                # Without the secret anyone could POST forged updates, impersonating shop owners
+                webhook_secret = os.getenv('TELEGRAM_WEBHOOK_SECRET')
+                if not webhook_secret:
+                    logger.error("TELEGRAM_WEBHOOK_SECRET is required when TELEGRAM_WEBHOOK_URL is set")
+                    sys.exit(1)
+
+                # Telegram pushes updates, so there is no getUpdates long poll to keep open
+                application.run_webhook(
+                    listen='0.0.0.0',
+                    port=int(os.getenv('PORT', DEFAULT_WEBHOOK_PORT)),
+                    url_path=WEBHOOK_URL_PATH,
+                    webhook_url=f"{webhook_url.rstrip('/')}/{WEBHOOK_URL_PATH}",
+                    secret_token=webhook_secret,
+                    allowed_updates=Update.ALL_TYPES
+                )
+            else:
+                application.run_polling(allowed_updates=Update.ALL_TYPES)
 
         except Exception as e:
-            logger.error(f"Error running bot: {e}")
+            logger.error("Error running bot: %s", e)
             sys.exit(1)
 
 def main():